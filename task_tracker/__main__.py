@@ -0,0 +1,9 @@
+import os
+import sys
+
+# Modules in this directory import each other by top-level name
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from server import main
+
+main()
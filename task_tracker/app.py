@@ -1,21 +1,77 @@
-from flask import Flask, redirect, url_for
+from flask import Flask, redirect, url_for, session, jsonify, request, abort
 from flask_login import LoginManager, current_user
+from sqlalchemy import text
+from sqlalchemy.orm import make_transient_to_detached
 from config import Config
 from models import db, User
-from routes.auth import auth_bp, bcrypt
-from routes.tasks import tasks_bp
+from cache import user_cache, platform_count_cache
+from sharding import shards, init_sharding
+from instrumentation import init_instrumentation, record, StartupTimer
+from security import remember_identity, forget_identity
+from routes.auth import auth_bp
+from routes.tasks import tasks_bp, toggle_batcher
 from routes.analytics import analytics_bp
 from routes.api_integration import api_bp
 import os
+import time
+
+# Requests that may change data always confirm the user against the database
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
 
 def create_app(config_class=Config):
     """Application factory pattern"""
-    app = Flask(__name__)
-    app.config.from_object(config_class)
+    timer = StartupTimer()
+    
+    with timer.phase('config'):
+        app = Flask(__name__)
+        app.config.from_object(config_class)
+    
+    with timer.phase('extensions'):
+        init_extensions(app)
+    
+    with timer.phase('blueprints'):
+        toggle_batcher.init_app(app)
+        app.register_blueprint(auth_bp)
+        app.register_blueprint(tasks_bp)
+        app.register_blueprint(analytics_bp)
+        app.register_blueprint(api_bp)
+        register_core_routes(app)
+    
+    # Create or check database tables
+    if app.config['SCHEMA_ON_STARTUP']:
+        with timer.phase('schema'), app.app_context():
+            if app.config['FAST_STARTUP']:
+                from migrations import check_schema_version
+                check_schema_version(auto_migrate=app.config['AUTO_MIGRATE'])
+            else:
+                shards.create_all()
+                shards.init_schemas(app.logger.info)
+    
+    app.extensions['startup_timings'] = timer.report()
+    app.logger.info('Startup timings (ms): %s', app.extensions['startup_timings'])
+    
+    return app
+
+
+def init_extensions(app):
+    """Initialize database, hashing, login and instrumentation"""
+    from security import bcrypt, init_security
+    from events import broker
+    from http_cache import init_http_cache
+    from outbound import init_outbound
+    
+    # Archive bind falls back to the main database when no URL is configured
+    binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+    binds.setdefault('archive', app.config['ARCHIVE_DATABASE_URL'] or app.config['SQLALCHEMY_DATABASE_URI'])
+    app.config['SQLALCHEMY_BINDS'] = binds
+    init_sharding(app)
     
-    # Initialize extensions
     db.init_app(app)
     bcrypt.init_app(app)
+    init_security(app)
+    init_outbound(app)
+    broker.init_app(app)
+    init_http_cache(app)
     
     # Initialize Flask-Login
     login_manager = LoginManager()
@@ -24,16 +80,60 @@ def create_app(config_class=Config):
     login_manager.login_message = 'Please log in to access this page.'
     login_manager.login_message_category = 'info'
     
+    user_cache.configure(ttl=app.config['USER_CACHE_TTL'])
+    platform_count_cache.configure(ttl=app.config['PLATFORM_COUNT_CACHE_TTL'])
+    
     @login_manager.user_loader
     def load_user(user_id):
-        return User.query.get(int(user_id))
-    
-    # Register blueprints
-    app.register_blueprint(auth_bp)
-    app.register_blueprint(tasks_bp)
-    app.register_blueprint(analytics_bp)
-    app.register_blueprint(api_bp)
-    
+        """Load the logged-in user, avoiding a query when possible.
+        
+        Flask-Login keeps the result on ``g`` for the rest of the request,
+        so this runs at most once per request.
+        """
+        user_id = int(user_id)
+        
+        # Send task and stats queries to the database holding this user's data
+        shards.pin(user_id)
+        
+        # Cached identities are only trusted for reads. Another worker may
+        # have changed or deleted the user, and its invalidation only reaches
+        # its own cache, so writes always check the row
+        trusted = request.method in SAFE_METHODS
+        ttl = app.config['USER_CACHE_TTL']
+        
+        # Identity stored in the signed session cookie, re-checked every ttl seconds
+        identity = session.get('_user_identity')
+        if (trusted and app.config['USER_SESSION_IDENTITY'] and identity
+                and identity.get('id') == user_id
+                and time.time() - session.get('_user_identity_at', 0) < ttl):
+            record('user_session_hits')
+            return attach_user(identity)
+        
+        # Per-process cache, invalidated when this process changes the user row
+        identity = user_cache.get(user_id) if trusted else None
+        if identity is not None:
+            record('user_cache_hits')
+            return attach_user(identity)
+        
+        record('user_cache_misses')
+        user = db.session.get(User, user_id)
+        if user is not None:
+            # The fresh row decides where writes go; none while a move runs
+            shards.pin(user_id, user.shard)
+            if not trusted and shards.moving(user.shard_moved_at):
+                abort(503, 'Your data is being moved. Please try again in a moment.')
+            user_cache.set(user_id, user.identity())
+            if app.config['USER_SESSION_IDENTITY']:
+                remember_identity(user)
+        else:
+            forget_identity()
+        return user
+    
+    init_instrumentation(app)
+
+
+def register_core_routes(app):
+    """Root redirect and health checks"""
     # Root route
     @app.route('/')
     def index():
@@ -41,11 +141,25 @@ def create_app(config_class=Config):
             return redirect(url_for('dashboard.index'))
         return redirect(url_for('auth.login'))
     
-    # Create database tables
-    with app.app_context():
-        db.create_all()
-    
-    return app
+    # Health checks for process managers and load balancers
+    @app.route('/health/live')
+    def health_live():
+        return jsonify({'status': 'ok'})
+    
+    @app.route('/health/ready')
+    def health_ready():
+        try:
+            db.session.execute(text('SELECT 1'))
+        except Exception:
+            return jsonify({'status': 'unavailable'}), 503
+        return jsonify({'status': 'ready'})
+
+
+def attach_user(identity):
+    """Rebuild a User from cached fields and attach it to the session without a query"""
+    user = User(**identity)
+    make_transient_to_detached(user)
+    return db.session.merge(user, load=False)
 
 
 if __name__ == '__main__':
@@ -55,6 +169,7 @@ if __name__ == '__main__':
     
     # Create and run the app
     app = create_app()
+    timings = ', '.join(f'{name} {ms}ms' for name, ms in app.extensions['startup_timings'].items())
     
     # Get port from environment or use default
     port = int(os.environ.get('PORT', 5000))
@@ -68,6 +183,7 @@ if __name__ == '__main__':
     
     📝 To run the application:
        python app.py
+       python -m task_tracker serve   (production, multi-process)
     
     🌐 Access the application at:
        http://localhost:{port}
@@ -80,6 +196,8 @@ if __name__ == '__main__':
        ✓ LeetCode API Integration
        ✓ Productivity Insights
     
+    ⏱️  Startup: {timings}
+    
     ⚙️  Configuration:
        - Database: SQLite (task_tracker.db)
        - Copy .env.example to .env for custom settings
@@ -0,0 +1,90 @@
+from datetime import datetime, timedelta
+from collections import Counter
+from sqlalchemy import select
+from models import db, User, Task, ArchivedTask, TaskRollup
+from sharding import shards
+from leaderboards import STREAK_LOOKBACK_DAYS
+
+# Streak scores are recomputed from the hot table, so archived tasks must
+# be older than their lookback (the charts only need the last 7 weeks)
+MIN_ARCHIVE_AGE_DAYS = STREAK_LOOKBACK_DAYS
+
+ARCHIVE_COLUMNS = ['id', 'user_id', 'title', 'description', 'platform', 'status', 'created_at', 'completed_at']
+
+
+def archive_completed_tasks(older_than_days, batch_size=1000, report=print):
+    """Move completed tasks older than the cutoff into tasks_archive, batch by batch.
+    
+    Each batch is first copied into the archive (skipping ids already there,
+    so an interrupted run can simply be repeated), then removed from the hot
+    table in the same transaction that adds its counts to task_rollups.
+    Shards are processed one after another.
+    """
+    if older_than_days < MIN_ARCHIVE_AGE_DAYS:
+        raise ValueError(f'Tasks must be at least {MIN_ARCHIVE_AGE_DAYS} days old to be archived')
+    
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    moved = 0
+    for shard in shards.all():
+        with shards.using(shard):
+            moved += _archive_shard(cutoff, batch_size, report)
+    
+    report(f'Archived {moved} completed tasks older than {older_than_days} days')
+    return moved
+
+
+def _archive_shard(cutoff, batch_size, report):
+    """Archive one shard's eligible tasks; the caller pins the shard"""
+    tasks = Task.__table__
+    archive = ArchivedTask.__table__
+    archive_engine = db.engines['archive']
+    moved = 0
+    
+    while True:
+        rows = db.session.execute(
+            select(*[tasks.c[name] for name in ARCHIVE_COLUMNS])
+            .where(tasks.c.status == 'completed', tasks.c.completed_at < cutoff)
+            .order_by(tasks.c.id)
+            .limit(batch_size)
+        ).mappings().all()
+        if not rows:
+            break
+        ids = [row['id'] for row in rows]
+        
+        # 1. Copy into the archive database
+        with archive_engine.begin() as conn:
+            existing = set(conn.execute(select(archive.c.id).where(archive.c.id.in_(ids))).scalars())
+            new_rows = [dict(row, archived_at=datetime.utcnow()) for row in rows if row['id'] not in existing]
+            if new_rows:
+                conn.execute(archive.insert(), new_rows)
+        
+        # 2. Roll up counts and delete from the hot table atomically
+        counts = Counter((row['user_id'], row['platform'], row['completed_at'].weekday()) for row in rows)
+        for (user_id, platform, weekday), count in counts.items():
+            rollup = db.session.get(TaskRollup, (user_id, platform, weekday))
+            if rollup is None:
+                db.session.add(TaskRollup(user_id=user_id, platform=platform, weekday=weekday, completed=count))
+            else:
+                rollup.completed += count
+        db.session.execute(tasks.delete().where(tasks.c.id.in_(ids)))
+        
+        # Core deletes skip the mapper events, so bump data versions here
+        users = User.__table__
+        db.session.execute(
+            users.update()
+            .where(users.c.id.in_({row['user_id'] for row in rows}))
+            .values(data_version=users.c.data_version + 1)
+        )
+        db.session.commit()
+        
+        moved += len(rows)
+        report(f'  archived {moved} tasks')
+    return moved
+
+
+def archived_weekday_counts(user_id):
+    """Archived completions per weekday (0 = Monday) for a user"""
+    rows = db.session.query(TaskRollup.weekday, db.func.sum(TaskRollup.completed)).filter(
+        TaskRollup.user_id == user_id
+    ).group_by(TaskRollup.weekday).all()
+    return {weekday: int(count) for weekday, count in rows}
@@ -0,0 +1,93 @@
+import hashlib
+import math
+import threading
+import time
+
+
+class TTLCache:
+    """Small thread-safe in-process cache with per-entry expiry"""
+    
+    def __init__(self, ttl=60, maxsize=1024):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data = {}
+        self._lock = threading.Lock()
+    
+    def configure(self, ttl=None, maxsize=None):
+        """Update cache settings from app config"""
+        if ttl is not None:
+            self.ttl = ttl
+        if maxsize is not None:
+            self.maxsize = maxsize
+        self.clear()
+    
+    def get(self, key, default=None):
+        """Return a cached value, or default if missing or expired"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return default
+            return value
+    
+    def set(self, key, value, ttl=None):
+        """Store a value; a ttl of 0 disables caching"""
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0:
+            return
+        with self._lock:
+            if len(self._data) >= self.maxsize and key not in self._data:
+                self._evict()
+            self._data[key] = (value, time.monotonic() + ttl)
+    
+    def invalidate(self, key):
+        """Drop a single entry"""
+        with self._lock:
+            self._data.pop(key, None)
+    
+    def clear(self):
+        """Drop every entry"""
+        with self._lock:
+            self._data.clear()
+    
+    def _evict(self):
+        # Drop expired entries first, then the oldest insertion if still full
+        now = time.monotonic()
+        for key in [k for k, (_, exp) in self._data.items() if exp < now]:
+            del self._data[key]
+        if len(self._data) >= self.maxsize:
+            del self._data[next(iter(self._data))]
+
+
+class BloomFilter:
+    """Compact set membership test with no false negatives"""
+    
+    def __init__(self, capacity=10000, error_rate=0.01):
+        capacity = max(capacity, 1)
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+    
+    def _positions(self, item):
+        # Double hashing: derive k positions from two 64-bit halves of one digest
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'big')
+        h2 = int.from_bytes(digest[8:], 'big') | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hash_count))
+    
+    def add(self, item):
+        for pos in self._positions(item):
+            self._bits[pos >> 3] |= 1 << (pos & 7)
+    
+    def __contains__(self, item):
+        return all(self._bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+
+# Per-process cache of user identity rows, keyed by user id
+user_cache = TTLCache(ttl=300, maxsize=4096)
+
+# Per-platform task counts keyed by user id, stored as (data_version, counts)
+platform_count_cache = TTLCache(ttl=300, maxsize=4096)
@@ -11,15 +11,136 @@ class Config:
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///task_tracker.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
+    # Archived tasks live on the 'archive' bind; defaults to the main database
+    ARCHIVE_DATABASE_URL = os.environ.get('ARCHIVE_DATABASE_URL')
+    ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS', 400))
+    
+    # Extra databases for task and platform stats data, as a comma-separated
+    # list of URLs; DATABASE_URL is shard 0 and keeps users and shared tables.
+    # Each user's shard is looked up at most every SHARD_DIRECTORY_TTL seconds
+    # for reads. A user's writes are refused while their move runs, for at
+    # most SHARD_MOVE_TIMEOUT seconds (a move older than that was abandoned)
+    SHARD_DATABASE_URLS = [url.strip() for url in os.environ.get('SHARD_DATABASE_URLS', '').split(',') if url.strip()]
+    SHARD_DIRECTORY_TTL = int(os.environ.get('SHARD_DIRECTORY_TTL', 30))
+    SHARD_MOVE_TIMEOUT = int(os.environ.get('SHARD_MOVE_TIMEOUT', 600))
+    
+    # Fast startup checks the schema version table instead of running
+    # db.create_all() (which reflects every table) on each boot
+    FAST_STARTUP = os.environ.get('FAST_STARTUP', 'true').lower() == 'true'
+    
+    # Apply pending migrations at boot instead of refusing to start
+    AUTO_MIGRATE = os.environ.get('AUTO_MIGRATE', 'false').lower() == 'true'
+    
+    # Set to False to skip schema creation and checks at boot entirely (the
+    # migrate command does its own)
+    SCHEMA_ON_STARTUP = True
+    
     # Session configuration
     PERMANENT_SESSION_LIFETIME = timedelta(days=7)
     
+    # User loading: how long (seconds) a cached identity is trusted on read
+    # requests (0 disables), and whether to keep the identity in the signed
+    # session to skip the lookup. Other workers' changes to a user show up
+    # after at most this long; writes always check the database
+    USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', 30))
+    USER_SESSION_IDENTITY = os.environ.get('USER_SESSION_IDENTITY', 'false').lower() == 'true'
+    
+    # Per-platform task counts are cached per user and kept up to date by
+    # this process's writes (0 disables)
+    PLATFORM_COUNT_CACHE_TTL = int(os.environ.get('PLATFORM_COUNT_CACHE_TTL', 300))
+    
+    # Instrumentation: add X-DB-Queries headers and expose /debug/stats to
+    # the usernames listed in DEBUG_STATS_USERS (comma-separated)
+    SQL_QUERY_STATS = os.environ.get('SQL_QUERY_STATS', 'false').lower() == 'true'
+    DEBUG_STATS_USERS = [name.strip() for name in os.environ.get('DEBUG_STATS_USERS', '').split(',') if name.strip()]
+    
+    # Password hashing: bcrypt work factor (existing hashes are upgraded on
+    # login) and the bounded pool that runs it off the request threads
+    BCRYPT_LOG_ROUNDS = int(os.environ.get('BCRYPT_LOG_ROUNDS', 12))
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))
+    PASSWORD_HASH_QUEUE = int(os.environ.get('PASSWORD_HASH_QUEUE', 8))
+    PASSWORD_HASH_TIMEOUT = 10
+    
+    # Login throttling: attempts allowed per period (seconds), 0 disables
+    LOGIN_RATE_PER_IP = int(os.environ.get('LOGIN_RATE_PER_IP', 20))
+    LOGIN_RATE_PER_ACCOUNT = int(os.environ.get('LOGIN_RATE_PER_ACCOUNT', 5))
+    LOGIN_RATE_PERIOD = 60
+    
+    # Number of reverse proxies in front of the app whose X-Forwarded-For and
+    # X-Forwarded-Proto headers are trusted (0 uses the socket address)
+    TRUSTED_PROXIES = int(os.environ.get('TRUSTED_PROXIES', 0))
+    
+    # Seconds before the username availability Bloom filter is rebuilt
+    USERNAME_FILTER_TTL = 300
+    
+    # Live dashboard updates over Server-Sent Events. Every open dashboard
+    # holds a connection, which ties up a whole thread on sync and gthread
+    # workers, so they are on by default only with gevent workers.
+    # Cross-process delivery relays events between gunicorn workers through
+    # the dashboard_events table; ids skipped by a poll are looked for again
+    # for SSE_POLL_OVERLAP seconds to catch transactions that committed late
+    SSE_ENABLED = os.environ.get(
+        'SSE_ENABLED', str(os.environ.get('WEB_WORKER_CLASS') == 'gevent')
+    ).lower() == 'true'
+    SSE_CROSS_PROCESS = os.environ.get('SSE_CROSS_PROCESS', 'true').lower() == 'true'
+    SSE_POLL_INTERVAL = 1.0
+    SSE_POLL_OVERLAP = 30
+    SSE_HEARTBEAT = 15
+    
+    # HTTP response compression (brotli is used when the package is installed).
+    # Level 6 gzip / quality 4 brotli keep most of the size win at low CPU cost
+    COMPRESS_RESPONSES = os.environ.get('COMPRESS_RESPONSES', 'true').lower() == 'true'
+    COMPRESS_MIN_SIZE = 1024
+    GZIP_LEVEL = 6
+    BROTLI_LEVEL = 4
+    
+    # Nightly platform sync (python -m task_tracker sync-all)
+    SYNC_CONCURRENCY = int(os.environ.get('SYNC_CONCURRENCY', 8))
+    # GitHub allows 5000 requests an hour with a token and 60 without, and
+    # each profile takes 3 requests; the default rate (profiles/second)
+    # spends at most 90% of the hourly limit. Without a token that is one
+    # profile every 200 seconds, so the nightly sync needs GITHUB_TOKEN
+    SYNC_GITHUB_HOURLY_LIMIT = int(os.environ.get('SYNC_GITHUB_HOURLY_LIMIT',
+                                                  5000 if os.environ.get('GITHUB_TOKEN') else 60))
+    SYNC_GITHUB_RATE = float(os.environ.get('SYNC_GITHUB_RATE', 0.9 * SYNC_GITHUB_HOURLY_LIMIT / 3600 / 3))
+    SYNC_LEETCODE_RATE = float(os.environ.get('SYNC_LEETCODE_RATE', 2))  # batches/second
+    SYNC_LEETCODE_BATCH_SIZE = 10  # usernames per GraphQL query
+    SYNC_WRITE_BATCH_SIZE = 500  # rows per transaction
+    
+    # Team leaderboards: entries shown per board, and how stale (seconds)
+    # the per-process rank index may get before it is reloaded
+    LEADERBOARD_SIZE = 10
+    LEADERBOARD_REFRESH = 30
+    
+    # Coalesce task toggles from concurrent requests into one commit per
+    # window (milliseconds); mostly useful on SQLite where each commit fsyncs
+    TOGGLE_BATCHING = os.environ.get('TOGGLE_BATCHING', 'false').lower() == 'true'
+    TOGGLE_BATCH_WINDOW_MS = 5
+    TOGGLE_BATCH_MAX = 100
+    
+    # Rows fetched per round trip while streaming the task list
+    TASK_LIST_CHUNK_SIZE = int(os.environ.get('TASK_LIST_CHUNK_SIZE', 200))
+    
+    # Outbound calls to GitHub and LeetCode: per-attempt timeout (seconds),
+    # retries with jittered exponential backoff for connection errors and
+    # 429/5xx answers (a timeout is not retried), a circuit breaker per service
+    # that fails fast for OUTBOUND_RESET_TIMEOUT seconds after consecutive
+    # failures, and how long fetched profiles are reused
+    OUTBOUND_TIMEOUT = float(os.environ.get('OUTBOUND_TIMEOUT', 5))
+    OUTBOUND_RETRIES = int(os.environ.get('OUTBOUND_RETRIES', 2))
+    OUTBOUND_BACKOFF = 0.25
+    OUTBOUND_FAILURE_THRESHOLD = 5
+    OUTBOUND_RESET_TIMEOUT = 30
+    OUTBOUND_CACHE_TTL = int(os.environ.get('OUTBOUND_CACHE_TTL', 60))
+    
     # WTForms configuration
     WTF_CSRF_ENABLED = True
     WTF_CSRF_TIME_LIMIT = None
     
     # API Keys (optional - for GitHub and LeetCode)
     GITHUB_TOKEN = os.environ.get('GITHUB_TOKEN')
+    GITHUB_API_URL = os.environ.get('GITHUB_API_URL', 'https://api.github.com')
+    LEETCODE_GRAPHQL_URL = os.environ.get('LEETCODE_GRAPHQL_URL', 'https://leetcode.com/graphql')
     
     # Application settings
     TASKS_PER_PAGE = 20
@@ -0,0 +1,157 @@
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from models import db, DashboardEvent
+
+# Identifies events published by this process so the poller skips them
+ORIGIN = f'{os.getpid()}-{uuid.uuid4().hex[:8]}'
+
+# Larger id jumps (sequence caches, bulk deletes) are not tracked as gaps
+MAX_POLL_GAP = 1000
+
+
+class EventBroker:
+    """Fan out small per-user dashboard deltas to Server-Sent Event streams.
+    
+    Events are delivered to local subscribers when the publishing transaction
+    commits. With cross-process delivery on, they are also written to the
+    dashboard_events table in that same transaction, and one poller thread
+    per process forwards other workers' events to its own subscribers.
+    """
+    
+    def __init__(self):
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+        self._app = None
+        self._poller = None
+        self.enabled = False
+        self.cross_process = False
+        self.poll_interval = 1.0
+        self.poll_overlap = timedelta(seconds=30)
+        self.queue_size = 100
+        self._last_id = 0
+        self._gaps = {}
+    
+    def init_app(self, app):
+        self._app = app
+        self.enabled = app.config['SSE_ENABLED']
+        self.cross_process = self.enabled and app.config['SSE_CROSS_PROCESS']
+        self.poll_interval = app.config['SSE_POLL_INTERVAL']
+        self.poll_overlap = timedelta(seconds=app.config['SSE_POLL_OVERLAP'])
+    
+    def subscribe(self, user_id):
+        """Register a queue that receives the user's events"""
+        q = queue.Queue(maxsize=self.queue_size)
+        with self._lock:
+            self._subscribers[user_id].add(q)
+            if self.cross_process and self._poller is None:
+                self._poller = threading.Thread(target=self._poll, name='sse-poller', daemon=True)
+                self._poller.start()
+        return q
+    
+    def unsubscribe(self, user_id, q):
+        with self._lock:
+            self._subscribers[user_id].discard(q)
+            if not self._subscribers[user_id]:
+                del self._subscribers[user_id]
+    
+    def publish(self, user_id, event_type, data):
+        """Queue an event to go out when the current DB transaction commits"""
+        if not self.enabled:
+            return
+        payload = {'event': event_type, 'data': data}
+        db.session.info.setdefault('pending_events', []).append((user_id, payload))
+        if self.cross_process:
+            db.session.add(DashboardEvent(user_id=user_id, origin=ORIGIN, payload=json.dumps(payload)))
+    
+    def deliver(self, user_id, payload):
+        """Hand an event to this process's subscribers for the user"""
+        with self._lock:
+            subscribers = list(self._subscribers.get(user_id, ()))
+        for q in subscribers:
+            try:
+                q.put_nowait(payload)
+            except queue.Full:
+                # Client is too far behind for deltas; tell it to refetch
+                q.queue.clear()
+                q.put_nowait({'event': 'resync', 'data': {}})
+    
+    def _poll(self):
+        """Forward events written by other processes to local subscribers"""
+        with self._app.app_context():
+            # Events written before this process subscribed are not replayed
+            self.reset_poll_position()
+            last_prune = time.monotonic()
+            db.session.remove()
+            
+            while True:
+                time.sleep(self.poll_interval)
+                try:
+                    self.poll_once()
+                    if time.monotonic() - last_prune > 60:
+                        cutoff = datetime.utcnow() - max(timedelta(minutes=5), 2 * self.poll_overlap)
+                        DashboardEvent.query.filter(DashboardEvent.created_at < cutoff).delete()
+                        db.session.commit()
+                        last_prune = time.monotonic()
+                except Exception:
+                    db.session.rollback()
+                    self._app.logger.exception('SSE event poll failed')
+                finally:
+                    db.session.remove()
+    
+    def reset_poll_position(self):
+        """Start polling after the newest event already in the table"""
+        self._last_id = db.session.query(db.func.max(DashboardEvent.id)).scalar() or 0
+        self._gaps = {}
+    
+    def poll_once(self):
+        """Read events past the high-water mark and deliver other processes' ones.
+        
+        Ids are assigned at insert but rows become visible at commit, so a
+        row can appear after rows with higher ids. Ids skipped over by the
+        high-water mark are remembered as gaps for poll_overlap and read
+        again until they show up; a gap that never fills was rolled back.
+        The position advances even with no subscribers, so a dashboard
+        opened later does not get a replay on top of fresh data.
+        """
+        now = time.monotonic()
+        floor = min(self._gaps) - 1 if self._gaps else self._last_id
+        rows = DashboardEvent.query.filter(DashboardEvent.id > floor).order_by(DashboardEvent.id).all()
+        for row in rows:
+            if row.id <= self._last_id and self._gaps.pop(row.id, None) is None:
+                continue
+            if row.id > self._last_id:
+                if row.id - self._last_id <= MAX_POLL_GAP:
+                    self._gaps.update(dict.fromkeys(range(self._last_id + 1, row.id), now))
+                self._last_id = row.id
+            if row.origin != ORIGIN:
+                self.deliver(row.user_id, json.loads(row.payload))
+        
+        expired = now - self.poll_overlap.total_seconds()
+        self._gaps = {event_id: noticed for event_id, noticed in self._gaps.items() if noticed > expired}
+
+
+broker = EventBroker()
+
+
+@event.listens_for(Session, 'after_commit')
+def _deliver_pending(session):
+    for user_id, payload in session.info.pop('pending_events', []):
+        broker.deliver(user_id, payload)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_pending(session):
+    session.info.pop('pending_events', None)
+
+
+def format_sse(payload):
+    """Serialize an event for the text/event-stream wire format"""
+    return f"event: {payload['event']}\ndata: {json.dumps(payload['data'])}\n\n"
@@ -0,0 +1,148 @@
+import gzip
+import hashlib
+import os
+from datetime import datetime
+from functools import wraps
+from flask import request, make_response, current_app
+from flask_login import current_user
+from models import db, User
+from cache import TTLCache
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+COMPRESSIBLE_TYPES = {
+    'application/json',
+    'application/javascript',
+    'text/css',
+    'text/html',
+    'text/javascript',
+    'text/plain',
+    'image/svg+xml',
+}
+
+# Compressed static files keyed by (path, mtime, encoding); bounded so old
+# versions of edited files do not pile up
+_static_cache = TTLCache(ttl=86400, maxsize=256)
+_fingerprints = {}
+
+
+def get_data_version(user_id):
+    """Current data version for a user (a single primary-key lookup)"""
+    return db.session.query(User.data_version).filter_by(id=user_id).scalar() or 0
+
+
+def etag_by_data_version(view):
+    """Answer with 304 when the user's data has not changed since the client's copy.
+    
+    The ETag combines the endpoint, user, data version and today's UTC date
+    (chart windows are relative to it), so the view body only runs on a miss.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        version = get_data_version(current_user.id)
+        raw = f'{request.full_path}|{current_user.id}|{version}|{datetime.utcnow().date().isoformat()}'
+        etag = hashlib.sha1(raw.encode('utf-8')).hexdigest()[:20]
+        
+        if request.if_none_match.contains_weak(etag):
+            response = make_response('', 304)
+        else:
+            response = make_response(view(*args, **kwargs))
+        
+        response.set_etag(etag, weak=True)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        response.vary.add('Cookie')
+        return response
+    return wrapper
+
+
+def static_fingerprint(filename):
+    """Short content hash of a static file, cached per modification time"""
+    path = os.path.join(current_app.static_folder, filename)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    
+    cached = _fingerprints.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    with open(path, 'rb') as f:
+        fingerprint = hashlib.md5(f.read()).hexdigest()[:10]
+    _fingerprints[path] = (mtime, fingerprint)
+    return fingerprint
+
+
+def choose_encoding():
+    """Best content coding the client accepts that we can produce"""
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        return 'br'
+    if accepted['gzip']:
+        return 'gzip'
+    return None
+
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=current_app.config['BROTLI_LEVEL'])
+    return gzip.compress(data, compresslevel=current_app.config['GZIP_LEVEL'], mtime=0)
+
+
+def init_http_cache(app):
+    """Fingerprint static URLs, set cache headers and compress large responses"""
+    
+    @app.url_defaults
+    def add_static_fingerprint(endpoint, values):
+        # url_for('static', ...) gains ?v=<hash>, so the file can be cached forever
+        if endpoint == 'static' and 'filename' in values and 'v' not in values:
+            fingerprint = static_fingerprint(values['filename'])
+            if fingerprint:
+                values['v'] = fingerprint
+    
+    @app.after_request
+    def cache_and_compress(response):
+        is_static = request.endpoint == 'static'
+        if is_static and 'v' in request.args:
+            response.cache_control.no_cache = None
+            response.cache_control.public = True
+            response.cache_control.max_age = 31536000
+            response.cache_control.immutable = True
+        
+        if not app.config['COMPRESS_RESPONSES']:
+            return response
+        if (response.status_code != 200 or (response.is_streamed and not is_static)
+                or 'Content-Encoding' in response.headers
+                or response.mimetype not in COMPRESSIBLE_TYPES):
+            return response
+        
+        response.vary.add('Accept-Encoding')
+        encoding = choose_encoding()
+        if encoding is None:
+            return response
+        
+        if is_static:
+            # Static files are sent lazily from disk; compress each version once
+            path = os.path.join(app.static_folder, request.view_args['filename'])
+            key = (path, os.path.getmtime(path), encoding)
+            body = _static_cache.get(key)
+            if body is None:
+                response.direct_passthrough = False
+                body = compress(response.get_data(), encoding)
+                _static_cache.set(key, body)
+        else:
+            data = response.get_data()
+            if len(data) < app.config['COMPRESS_MIN_SIZE']:
+                return response
+            body = compress(data, encoding)
+        
+        response.direct_passthrough = False
+        response.set_data(body)
+        response.headers['Content-Encoding'] = encoding
+        # A strong validator must change with the encoding; weaken it instead
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
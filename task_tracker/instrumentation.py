@@ -0,0 +1,82 @@
+import threading
+import time
+from contextlib import contextmanager
+from flask import g, has_request_context, abort
+from flask_login import login_required, current_user
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Process-wide counters, readable from /debug/stats or a shell
+stats = {
+    'requests': 0,
+    'queries': 0,
+    'user_cache_hits': 0,
+    'user_cache_misses': 0,
+    'user_session_hits': 0,
+}
+_lock = threading.Lock()
+_listening = False
+
+
+def record(name, amount=1):
+    """Increment a process-wide counter"""
+    with _lock:
+        stats[name] = stats.get(name, 0) + amount
+
+
+def snapshot():
+    """Return a copy of the counters including queries per request"""
+    with _lock:
+        data = dict(stats)
+    data['queries_per_request'] = round(data['queries'] / data['requests'], 2) if data['requests'] else 0
+    return data
+
+
+class StartupTimer:
+    """Collect wall-clock durations of the phases of create_app()"""
+    
+    def __init__(self):
+        self.timings = {}
+    
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = round((time.perf_counter() - start) * 1000, 2)
+    
+    def report(self):
+        """Timings in milliseconds, plus the total"""
+        return dict(self.timings, total=round(sum(self.timings.values()), 2))
+
+
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    record('queries')
+    if has_request_context():
+        g.query_count = g.get('query_count', 0) + 1
+
+
+def init_instrumentation(app):
+    """Count SQL statements per request when SQL_QUERY_STATS is enabled"""
+    global _listening
+    if not app.config.get('SQL_QUERY_STATS'):
+        return
+    
+    if not _listening:
+        event.listen(Engine, 'before_cursor_execute', _count_query)
+        _listening = True
+    
+    @app.after_request
+    def add_query_count_header(response):
+        record('requests')
+        response.headers['X-DB-Queries'] = str(g.get('query_count', 0))
+        return response
+    
+    @app.route('/debug/stats')
+    @login_required
+    def debug_stats():
+        # Process-wide numbers are for operators only
+        if current_user.username not in app.config['DEBUG_STATS_USERS']:
+            abort(404)
+        return dict(snapshot(), startup_ms=app.extensions.get('startup_timings', {}))
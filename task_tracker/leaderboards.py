@@ -0,0 +1,290 @@
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import event, func, select, inspect, bindparam
+from sqlalchemy.orm import Session
+from models import db, User, Task, PlatformStats, LeaderboardScore
+from sharding import shards
+
+# Streaks are rebuilt from completions within this many days; archiving
+# must leave them in place (see archival.MIN_ARCHIVE_AGE_DAYS)
+STREAK_LOOKBACK_DAYS = 400
+
+BOARDS = {
+    'weekly': 'Completions this week',
+    'streak': 'Current streak (days)',
+    'leetcode': 'LeetCode problems solved',
+}
+
+scores_table = LeaderboardScore.__table__
+tasks_table = Task.__table__
+
+
+class RankIndex:
+    """Fenwick tree over integer scores, answering "how many users score higher" in O(log max_score)"""
+    
+    def __init__(self, size=1024):
+        self.size = size
+        self.tree = [0] * (size + 1)
+        self.scores = {}
+    
+    def _add(self, score, delta):
+        i = score + 1
+        while i <= self.size:
+            self.tree[i] += delta
+            i += i & -i
+    
+    def _count_at_most(self, score):
+        i = min(score + 1, self.size)
+        total = 0
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+    
+    def set(self, user_id, score):
+        """Record a user's score; users without a positive score are left out of the ranking"""
+        self.discard(user_id)
+        if score <= 0:
+            return
+        if score >= self.size:
+            self._grow(score)
+        self.scores[user_id] = score
+        self._add(score, 1)
+    
+    def discard(self, user_id):
+        old = self.scores.pop(user_id, None)
+        if old is not None:
+            self._add(old, -1)
+    
+    def _grow(self, score):
+        while self.size <= score:
+            self.size *= 2
+        scores, self.scores = self.scores, {}
+        self.tree = [0] * (self.size + 1)
+        for user_id, value in scores.items():
+            self.set(user_id, value)
+    
+    def rank(self, score):
+        """1-based rank a user with this score holds (ties share a rank)"""
+        return len(self.scores) - self._count_at_most(score) + 1
+
+
+def today():
+    return datetime.utcnow().date()
+
+
+def current_period(board):
+    """Weekly boards are keyed by the Monday of the current week"""
+    if board == 'weekly':
+        day = today()
+        return (day - timedelta(days=day.weekday())).isoformat()
+    return ''
+
+
+def compute_streak(days):
+    """Consecutive days with a completion, counting back from today"""
+    days = set(days)
+    streak = 0
+    day = today()
+    while day in days:
+        streak += 1
+        day -= timedelta(days=1)
+    return streak
+
+
+def _as_date(value):
+    # SQLite returns date() as a string, PostgreSQL as a date
+    return datetime.strptime(value, '%Y-%m-%d').date() if isinstance(value, str) else value
+
+
+def upsert_score(session, board, user_id, score, last_day=None):
+    """Write one score row, inserting it if missing"""
+    period = current_period(board)
+    result = session.execute(
+        scores_table.update()
+        .where(scores_table.c.board == board, scores_table.c.period == period, scores_table.c.user_id == user_id)
+        .values(score=score, last_day=last_day)
+    )
+    if result.rowcount == 0:
+        session.execute(scores_table.insert().values(
+            board=board, period=period, user_id=user_id, score=score, last_day=last_day
+        ))
+
+
+def upsert_scores(session, board, scores):
+    """Write many users' scores on one board, {user_id: score}, in two batched statements"""
+    if not scores:
+        return
+    period = current_period(board)
+    existing = set(session.execute(
+        select(scores_table.c.user_id).where(
+            scores_table.c.board == board, scores_table.c.period == period,
+            scores_table.c.user_id.in_(list(scores))
+        )
+    ).scalars())
+    
+    updates = [{'b_user_id': user_id, 'b_score': score} for user_id, score in scores.items() if user_id in existing]
+    if updates:
+        session.execute(
+            scores_table.update()
+            .where(scores_table.c.board == board, scores_table.c.period == period,
+                   scores_table.c.user_id == bindparam('b_user_id'))
+            .values(score=bindparam('b_score'), last_day=None),
+            updates
+        )
+    inserts = [{'board': board, 'period': period, 'user_id': user_id, 'score': score}
+               for user_id, score in scores.items() if user_id not in existing]
+    if inserts:
+        session.execute(scores_table.insert(), inserts)
+
+
+def refresh_task_scores(session, user_id):
+    """Recompute a user's weekly and streak scores with two indexed queries.
+    
+    Runs through the session so the task queries go to the user's shard and
+    the score writes to the main database.
+    """
+    week_start = datetime.fromisoformat(current_period('weekly'))
+    weekly = session.execute(
+        select(func.count()).select_from(tasks_table).where(
+            tasks_table.c.user_id == user_id,
+            tasks_table.c.status == 'completed',
+            tasks_table.c.completed_at >= week_start
+        )
+    ).scalar()
+    upsert_score(session, 'weekly', user_id, weekly)
+    
+    since = datetime.utcnow() - timedelta(days=STREAK_LOOKBACK_DAYS)
+    days = [_as_date(d) for d in session.execute(
+        select(func.date(tasks_table.c.completed_at)).distinct().where(
+            tasks_table.c.user_id == user_id,
+            tasks_table.c.status == 'completed',
+            tasks_table.c.completed_at >= since
+        )
+    ).scalars()]
+    upsert_score(session, 'streak', user_id, compute_streak(days), last_day=max(days) if days else None)
+
+
+def leetcode_score(data):
+    return int((data.get('problems_solved') or {}).get('total') or 0)
+
+
+@event.listens_for(Session, 'after_flush')
+def _update_scores(session, flush_context):
+    """Keep leaderboard rows in step with task completions and LeetCode syncs"""
+    task_users = set()
+    leetcode = {}
+    
+    for obj in session.new:
+        if isinstance(obj, Task) and obj.status == 'completed':
+            task_users.add(obj.user_id)
+        elif isinstance(obj, PlatformStats) and obj.platform == 'leetcode':
+            leetcode[obj.user_id] = leetcode_score(obj.get_data())
+    for obj in session.dirty:
+        if isinstance(obj, Task):
+            state = inspect(obj)
+            if state.attrs.status.history.has_changes() or state.attrs.completed_at.history.has_changes():
+                task_users.add(obj.user_id)
+        elif isinstance(obj, PlatformStats) and obj.platform == 'leetcode':
+            leetcode[obj.user_id] = leetcode_score(obj.get_data())
+    for obj in session.deleted:
+        if isinstance(obj, Task) and obj.status == 'completed':
+            task_users.add(obj.user_id)
+    
+    if not task_users and not leetcode:
+        return
+    for user_id in task_users:
+        refresh_task_scores(session, user_id)
+    upsert_scores(session, 'leetcode', leetcode)
+
+
+def rebuild_all(report=print):
+    """Recompute every leaderboard from scratch (initial load or repair)"""
+    db.session.execute(scores_table.delete())
+    
+    task_users = leetcode_users = 0
+    for shard in shards.all():
+        with shards.using(shard):
+            user_ids = db.session.execute(
+                select(tasks_table.c.user_id).distinct().where(tasks_table.c.status == 'completed')
+            ).scalars().all()
+            for user_id in user_ids:
+                refresh_task_scores(db.session, user_id)
+            task_users += len(user_ids)
+            
+            for stat in PlatformStats.query.filter_by(platform='leetcode').yield_per(1000):
+                upsert_score(db.session, 'leetcode', stat.user_id, leetcode_score(stat.get_data()))
+                leetcode_users += 1
+    
+    db.session.commit()
+    report(f'Rebuilt leaderboards for {task_users} task users and {leetcode_users} LeetCode users')
+
+
+def _live_filter(board):
+    """Conditions selecting the rows that count on a board today"""
+    conditions = [scores_table.c.board == board, scores_table.c.period == current_period(board)]
+    if board == 'streak':
+        # A streak ends when a day passes without a completion
+        conditions.append(scores_table.c.last_day == today())
+    return conditions
+
+
+# Per-process rank indexes, reloaded from leaderboard_scores when stale
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_rank_index(board, max_age):
+    key = (board, current_period(board), today())
+    with _indexes_lock:
+        cached = _indexes.get(board)
+        if cached and cached[0] == key and time.monotonic() - cached[1] < max_age:
+            return cached[2]
+    
+    index = RankIndex()
+    rows = db.session.execute(
+        select(scores_table.c.user_id, scores_table.c.score).where(*_live_filter(board))
+    )
+    for user_id, score in rows:
+        index.set(user_id, score)
+    
+    with _indexes_lock:
+        _indexes[board] = (key, time.monotonic(), index)
+    return index
+
+
+def top(board, limit=10):
+    """Highest scores on a board, read straight off the (board, period, score) index.
+    
+    Every score above a row is on the page before it, so ranks are counted
+    from the rows just read rather than from the cached rank index; tied
+    scores share a rank, as in my_rank.
+    """
+    rows = db.session.execute(
+        select(User.username, scores_table.c.score)
+        .join(User, User.id == scores_table.c.user_id)
+        .where(*_live_filter(board), scores_table.c.score > 0)
+        .order_by(scores_table.c.score.desc())
+        .limit(limit)
+    ).all()
+    
+    entries = []
+    for position, (username, score) in enumerate(rows, 1):
+        rank = entries[-1]['rank'] if entries and entries[-1]['score'] == score else position
+        entries.append({'username': username, 'score': score, 'rank': rank})
+    return entries
+
+
+def my_rank(board, user_id, max_age=30):
+    """The user's score and rank (None without a score); other users' scores may be up to max_age seconds old"""
+    score = db.session.execute(
+        select(scores_table.c.score).where(*_live_filter(board), scores_table.c.user_id == user_id)
+    ).scalar() or 0
+    
+    index = get_rank_index(board, max_age)
+    with _indexes_lock:
+        index.set(user_id, score)
+        rank = index.rank(score) if score > 0 else None
+        total = len(index.scores)
+    return {'score': score, 'rank': rank, 'total': total}
@@ -0,0 +1,231 @@
+import time
+from sqlalchemy import text, inspect
+from sqlalchemy.exc import DBAPIError
+from models import db, SchemaVersion, DashboardEvent, LeaderboardScore, ArchivedTask, TaskRollup, SCHEMA_VERSION
+from sharding import shards
+import leaderboards
+
+
+class MigrationProgress(db.Model):
+    """Checkpoint for each migration step so interrupted runs can resume"""
+    __tablename__ = 'schema_migration_progress'
+    
+    version = db.Column(db.Integer, primary_key=True)
+    step = db.Column(db.Integer, primary_key=True)
+    last_key = db.Column(db.Integer, default=0)
+    completed = db.Column(db.Boolean, default=False)
+
+
+class Migration:
+    """A numbered schema change made of idempotent steps"""
+    
+    def __init__(self, version, description, *steps):
+        self.version = version
+        self.description = description
+        self.steps = steps
+
+
+class MigrationContext:
+    """Operations available to migration steps, adapted to the DB backend"""
+    
+    def __init__(self, version, step, report=print):
+        self.version = version
+        self.step = step
+        self.report = report
+        self.dialect = db.engine.dialect.name
+    
+    def _progress(self):
+        progress = db.session.get(MigrationProgress, (self.version, self.step))
+        if progress is None:
+            progress = MigrationProgress(version=self.version, step=self.step, last_key=0, completed=False)
+            db.session.add(progress)
+        return progress
+    
+    def create_index(self, name, table, columns, unique=False):
+        """Create an index without blocking writes where the backend allows it"""
+        unique_sql = 'UNIQUE ' if unique else ''
+        cols = ', '.join(columns)
+        
+        if self.dialect == 'postgresql':
+            # CONCURRENTLY cannot run inside a transaction block
+            db.session.commit()
+            with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+                # A failed or interrupted concurrent build leaves an invalid
+                # index behind, which IF NOT EXISTS would keep; rebuild it
+                valid = conn.execute(
+                    text('SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(:name)'),
+                    {'name': name}
+                ).scalar()
+                if valid is False:
+                    conn.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS {name}'))
+                    self.report(f'  dropped invalid index {name}')
+                conn.execute(text(f'CREATE {unique_sql}INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} ({cols})'))
+        else:
+            db.session.execute(text(f'CREATE {unique_sql}INDEX IF NOT EXISTS {name} ON {table} ({cols})'))
+            db.session.commit()
+        self.report(f'  created index {name} on {table} ({cols})')
+    
+    def create_table(self, model):
+        """Create a model's table (and its indexes) if it does not exist"""
+        engine = db.engines[getattr(model, '__bind_key__', None)]
+        model.__table__.create(engine, checkfirst=True)
+        self.report(f'  created table {model.__tablename__}')
+    
+    def add_column(self, table, column, ddl_type, default_sql=None):
+        """Add a nullable column (or one with a constant default) if missing"""
+        existing = {c['name'] for c in inspect(db.engine).get_columns(table)}
+        if column in existing:
+            return
+        default = f' DEFAULT {default_sql}' if default_sql is not None else ''
+        db.session.execute(text(f'ALTER TABLE {table} ADD COLUMN {column} {ddl_type}{default}'))
+        db.session.commit()
+        self.report(f'  added column {table}.{column}')
+    
+    def backfill(self, table, set_sql, where_sql='1=1', batch_size=1000, params=None):
+        """Run an UPDATE in primary-key ordered chunks, committing a checkpoint after each"""
+        progress = self._progress()
+        if progress.completed:
+            return
+        
+        params = dict(params or {})
+        total = db.session.execute(
+            text(f'SELECT COUNT(*) FROM {table} WHERE id > :last AND ({where_sql})'),
+            dict(params, last=progress.last_key)
+        ).scalar()
+        done = 0
+        started = time.monotonic()
+        
+        while True:
+            ids = db.session.execute(
+                text(f'SELECT id FROM {table} WHERE id > :last AND ({where_sql}) ORDER BY id LIMIT :limit'),
+                dict(params, last=progress.last_key, limit=batch_size)
+            ).scalars().all()
+            if not ids:
+                break
+            
+            db.session.execute(
+                text(f'UPDATE {table} SET {set_sql} WHERE id >= :low AND id <= :high AND ({where_sql})'),
+                dict(params, low=ids[0], high=ids[-1])
+            )
+            progress.last_key = ids[-1]
+            db.session.commit()
+            
+            done += len(ids)
+            rate = done / max(time.monotonic() - started, 1e-6)
+            self.report(f'  {table}: {done}/{total} rows ({rate:.0f} rows/s)')
+        
+        progress.completed = True
+        db.session.commit()
+
+
+# Ordered list of schema changes. Version 1 is the original schema; the
+# last entry must match models.SCHEMA_VERSION.
+MIGRATIONS = [
+    Migration(1, 'Initial schema'),
+    Migration(
+        2, 'Composite index for per-user completion queries',
+        lambda ctx: ctx.create_index('ix_tasks_user_status_completed', 'tasks',
+                                     ['user_id', 'status', 'completed_at']),
+    ),
+    Migration(
+        3, 'Dashboard event log for Server-Sent Events',
+        lambda ctx: ctx.create_table(DashboardEvent),
+    ),
+    Migration(
+        4, 'Per-user data version for HTTP caching',
+        lambda ctx: ctx.add_column('users', 'data_version', 'INTEGER NOT NULL', default_sql='0'),
+    ),
+    Migration(
+        5, 'Precomputed leaderboard scores',
+        lambda ctx: ctx.create_table(LeaderboardScore),
+        lambda ctx: leaderboards.rebuild_all(ctx.report),
+    ),
+    Migration(
+        6, 'Task archive and rollups of archived completions',
+        lambda ctx: ctx.create_table(ArchivedTask),
+        lambda ctx: ctx.create_table(TaskRollup),
+    ),
+    Migration(
+        7, 'Shard directory column on users',
+        lambda ctx: ctx.add_column('users', 'shard', 'INTEGER NOT NULL', default_sql='0'),
+        lambda ctx: ctx.create_index('ix_users_shard', 'users', ['shard']),
+    ),
+    Migration(
+        8, 'Time of the last shard move on users',
+        lambda ctx: ctx.add_column('users', 'shard_moved_at', 'TIMESTAMP'),
+    ),
+]
+
+assert MIGRATIONS[-1].version == SCHEMA_VERSION, 'models.SCHEMA_VERSION must match the latest migration'
+
+
+def current_version():
+    """Schema version recorded in the database, or None if it is unversioned"""
+    try:
+        return db.session.execute(text('SELECT MAX(version) FROM schema_version')).scalar()
+    except DBAPIError:
+        db.session.rollback()
+        return None
+
+
+def pending_migrations():
+    """Migrations newer than the database's version"""
+    version = current_version() or 0
+    return [m for m in MIGRATIONS if m.version > version]
+
+
+def stamp(version):
+    """Record that the database is at the given version"""
+    db.session.add(SchemaVersion(version=version))
+    db.session.commit()
+
+
+def migrate(report=print):
+    """Apply pending migrations in order, resuming interrupted steps"""
+    if current_version() is None:
+        # Unversioned database: make sure the original tables exist first
+        shards.create_all()
+        stamp(1)
+    
+    shards.create_all()  # bookkeeping tables such as schema_migration_progress
+    # Shards added to SHARD_DATABASE_URLS since the last run get their tables
+    shards.init_schemas(report)
+    
+    applied = []
+    for migration in pending_migrations():
+        report(f'Applying {migration.version}: {migration.description}')
+        for step_number, step in enumerate(migration.steps):
+            step(MigrationContext(migration.version, step_number, report))
+        stamp(migration.version)
+        applied.append(migration.version)
+    return applied
+
+
+def check_schema_version(auto_migrate=False):
+    """Verify the stored schema version at boot instead of running create_all"""
+    version = current_version()
+    
+    if version is None:
+        # Fresh database: the models already describe the latest schema
+        if not inspect(db.engine).has_table('users'):
+            shards.create_all()
+            shards.init_schemas()
+            stamp(SCHEMA_VERSION)
+            return
+        # Pre-versioning database with existing tables: migrate from version 1
+        version = 0
+    
+    if version < SCHEMA_VERSION:
+        if auto_migrate:
+            migrate()
+            return
+        found = f'version {version}' if version else 'unversioned'
+        raise RuntimeError(
+            f'Database schema is {found} but the app expects version {SCHEMA_VERSION}. '
+            'Run "python -m task_tracker migrate" before starting the app.'
+        )
+    if version > SCHEMA_VERSION:
+        raise RuntimeError(
+            f'Database schema is at version {version}, newer than this app ({SCHEMA_VERSION}). '
+            'Deploy the matching application version.'
+        )
@@ -1,9 +1,23 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, object_session
 from datetime import datetime
+from cache import user_cache, platform_count_cache
+from sharding import ShardedSession
 import json
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': ShardedSession})
+
+# Bump together with a new entry in migrations.MIGRATIONS whenever the models change
+SCHEMA_VERSION = 8
+
+
+class SchemaVersion(db.Model):
+    """Single-row table recording which schema version the database is at"""
+    __tablename__ = 'schema_version'
+    
+    version = db.Column(db.Integer, primary_key=True)
 
 class User(UserMixin, db.Model):
     """User model for authentication and task ownership"""
@@ -14,6 +28,13 @@ class User(UserMixin, db.Model):
     email = db.Column(db.String(120), unique=True, nullable=False, index=True)
     password_hash = db.Column(db.String(128), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Bumped whenever the user's tasks or platform stats change (HTTP ETags)
+    data_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Which database holds the user's tasks and platform stats (0 = main)
+    shard = db.Column(db.Integer, nullable=False, default=0, server_default='0', index=True)
+    # When a running shard move started (NULL otherwise); the user's writes
+    # are refused and orphan purges leave them alone meanwhile
+    shard_moved_at = db.Column(db.DateTime)
     
     # Relationships
     tasks = db.relationship('Task', backref='owner', lazy='dynamic', cascade='all, delete-orphan')
@@ -24,8 +45,13 @@ class User(UserMixin, db.Model):
     
     def get_task_statistics(self):
         """Calculate user's task statistics"""
-        total_tasks = self.tasks.count()
-        completed_tasks = self.tasks.filter_by(status='completed').count()
+        # Archived tasks are all completed; their counts live in task_rollups
+        archived_tasks = db.session.query(db.func.coalesce(db.func.sum(TaskRollup.completed), 0)).filter(
+            TaskRollup.user_id == self.id
+        ).scalar()
+        
+        total_tasks = self.tasks.count() + archived_tasks
+        completed_tasks = self.tasks.filter_by(status='completed').count() + archived_tasks
         pending_tasks = self.tasks.filter_by(status='pending').count()
         
         return {
@@ -34,11 +60,145 @@ class User(UserMixin, db.Model):
             'pending': pending_tasks,
             'completion_rate': round((completed_tasks / total_tasks * 100) if total_tasks > 0 else 0, 1)
         }
+    
+    def get_platform_counts(self):
+        """Tasks per platform as {platform: {'tasks': n, 'archived': m}}.
+        
+        Cached with the data version it matches, so a hit costs a primary-key
+        lookup instead of scanning the user's tasks. Task writes in this
+        process update the cached counts in place when they commit (see
+        apply_platform_counts). Callers must not modify the result.
+        """
+        version = db.session.query(User.data_version).filter_by(id=self.id).scalar() or 0
+        cached = platform_count_cache.get(self.id)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        
+        counts = {}
+        active = db.session.query(Task.platform, db.func.count(Task.id)).filter(
+            Task.user_id == self.id
+        ).group_by(Task.platform)
+        for platform, count in active:
+            counts[platform] = {'tasks': count, 'archived': 0}
+        
+        archived = db.session.query(TaskRollup.platform, db.func.sum(TaskRollup.completed)).filter(
+            TaskRollup.user_id == self.id
+        ).group_by(TaskRollup.platform)
+        for platform, count in archived:
+            counts.setdefault(platform, {'tasks': 0, 'archived': 0})['archived'] = int(count)
+        
+        platform_count_cache.set(self.id, (version, counts))
+        return counts
+    
+    def identity(self):
+        """Essential fields needed to rebuild the user without a query"""
+        return {
+            'id': self.id,
+            'username': self.username,
+            'email': self.email
+        }
+
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def invalidate_cached_user(mapper, connection, target):
+    """Drop the cached identity whenever the user row changes"""
+    user_cache.invalidate(target.id)
+
+
+def mark_data_changed(mapper, connection, target):
+    """Remember whose data changed; versions are bumped once the flush ends"""
+    object_session(target).info.setdefault('changed_users', set()).add(target.user_id)
+
+
+@event.listens_for(Session, 'after_flush')
+def bump_data_versions(session, flush_context):
+    """Advance the owners' data versions in the same transaction as the change"""
+    user_ids = session.info.pop('changed_users', None)
+    if user_ids:
+        advance_data_versions(session, user_ids)
+        track_platform_counts(session, user_ids)
+
+
+def track_platform_counts(session, user_ids):
+    """Remember this flush's task count changes until the transaction commits.
+    
+    For users whose counts are cached, the version just written is read back
+    (the UPDATE holds the row, so it is this transaction's), which tells at
+    commit whether the cached counts are the ones the changes started from.
+    """
+    deltas = session.info.pop('platform_deltas', {})
+    cached = [user_id for user_id in user_ids if platform_count_cache.get(user_id) is not None]
+    versions = {}
+    if cached:
+        users = User.__table__
+        versions = dict(session.execute(
+            db.select(users.c.id, users.c.data_version).where(users.c.id.in_(cached))
+        ).all())
+    
+    pending = session.info.setdefault('platform_counts', {})
+    for user_id in set(user_ids) | set(deltas):
+        change = pending.setdefault(user_id, {'bumps': 0, 'version': None, 'delta': {}})
+        if user_id in user_ids:
+            change['bumps'] += 1
+        change['version'] = versions.get(user_id)
+        delta = deltas.get(user_id, {})
+        if change['delta'] is None or None in delta:
+            change['delta'] = None
+            continue
+        for platform, count in delta.items():
+            change['delta'][platform] = change['delta'].get(platform, 0) + count
+
+
+@event.listens_for(Session, 'after_commit')
+def apply_platform_counts(session):
+    """Update cached platform counts in place once their changes are committed"""
+    for user_id, change in session.info.pop('platform_counts', {}).items():
+        cached = platform_count_cache.get(user_id)
+        if cached is None:
+            continue
+        # Changes from elsewhere, or a version not read at flush time, mean
+        # the cached counts cannot be brought up to date from here
+        version, counts = cached
+        if change['version'] is None or change['delta'] is None or version != change['version'] - change['bumps']:
+            platform_count_cache.invalidate(user_id)
+            continue
+        
+        updated = {platform: dict(entry) for platform, entry in counts.items()}
+        for platform, count in change['delta'].items():
+            entry = updated.setdefault(platform, {'tasks': 0, 'archived': 0})
+            entry['tasks'] += count
+            if not entry['tasks'] and not entry['archived']:
+                del updated[platform]
+        platform_count_cache.set(user_id, (change['version'], updated))
+
+
+@event.listens_for(Session, 'after_rollback')
+def discard_platform_counts(session):
+    session.info.pop('platform_counts', None)
+    session.info.pop('platform_deltas', None)
+
+
+def advance_data_versions(session, user_ids):
+    """Advance the given users' data versions"""
+    # Core UPDATE through the session, so it reaches the main database even
+    # when the tasks live on another shard, and skips the identity cache
+    users = User.__table__
+    session.execute(
+        users.update()
+        .where(users.c.id.in_(user_ids))
+        .values(data_version=users.c.data_version + 1)
+    )
 
 
 class Task(db.Model):
     """Task model for tracking user tasks across different platforms"""
     __tablename__ = 'tasks'
+    __table_args__ = (
+        # Per-user completion lookups used by the dashboard analytics
+        db.Index('ix_tasks_user_status_completed', 'user_id', 'status', 'completed_at'),
+        {'info': {'sharded': True}},
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
@@ -49,6 +209,9 @@ class Task(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     completed_at = db.Column(db.DateTime, nullable=True)
     
+    # Live rows can be edited; see ArchivedTask
+    archived = False
+    
     def __repr__(self):
         return f'<Task {self.title}>'
     
@@ -66,17 +229,61 @@ class Task(db.Model):
     
     def toggle_status(self):
         """Toggle task status between pending and completed"""
-        if self.status == 'pending':
-            self.status = 'completed'
-            self.completed_at = datetime.utcnow()
-        else:
-            self.status = 'pending'
-            self.completed_at = None
+        self.set_status('completed' if self.status == 'pending' else 'pending')
+    
+    def set_status(self, status):
+        """Move the task to status (pending or completed); a no-op if it is already there"""
+        if status == self.status:
+            return
+        self.status = status
+        self.completed_at = datetime.utcnow() if status == 'completed' else None
+
+
+class ArchivedTask(db.Model):
+    """Completed task moved out of the hot tasks table (optionally into a separate database)"""
+    __tablename__ = 'tasks_archive'
+    __bind_key__ = 'archive'
+    __table_args__ = (
+        db.Index('ix_tasks_archive_user_created', 'user_id', 'created_at'),
+    )
+    
+    # Same id as the original row, which makes re-running an archive batch safe
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    user_id = db.Column(db.Integer, nullable=False)
+    title = db.Column(db.String(200), nullable=False)
+    description = db.Column(db.Text)
+    platform = db.Column(db.String(50), nullable=False)
+    status = db.Column(db.String(20), default='completed')
+    created_at = db.Column(db.DateTime)
+    completed_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    archived = True
+    
+    def __repr__(self):
+        return f'<ArchivedTask {self.title}>'
+    
+    def to_dict(self):
+        """Convert task to dictionary for JSON serialization"""
+        return dict(Task.to_dict(self), archived=True)
+
+
+class TaskRollup(db.Model):
+    """Completed-task counts of archived tasks, so analytics still include them"""
+    __tablename__ = 'task_rollups'
+    # Kept on the user's shard so archiving updates it atomically with the delete
+    __table_args__ = {'info': {'sharded': True}}
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    platform = db.Column(db.String(50), primary_key=True)
+    weekday = db.Column(db.Integer, primary_key=True)  # completion day, 0 = Monday
+    completed = db.Column(db.Integer, nullable=False, default=0)
 
 
 class PlatformStats(db.Model):
     """Model for storing API data from various platforms"""
     __tablename__ = 'platform_stats'
+    __table_args__ = {'info': {'sharded': True}}
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
@@ -98,3 +305,62 @@ class PlatformStats(db.Model):
         """Set data from dictionary"""
         self.data = json.dumps(data_dict)
         self.last_updated = datetime.utcnow()
+
+
+class DashboardEvent(db.Model):
+    """Short-lived log of dashboard deltas, used to fan events out across worker processes"""
+    __tablename__ = 'dashboard_events'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False, index=True)
+    origin = db.Column(db.String(64), nullable=False)
+    payload = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+
+class LeaderboardScore(db.Model):
+    """Precomputed per-user score on a team leaderboard"""
+    __tablename__ = 'leaderboard_scores'
+    __table_args__ = (
+        # Top-N reads walk this index from the highest score down
+        db.Index('ix_leaderboard_board_period_score', 'board', 'period', 'score'),
+    )
+    
+    board = db.Column(db.String(20), primary_key=True)  # weekly, streak, leetcode
+    period = db.Column(db.String(10), primary_key=True, default='')  # week start for weekly boards
+    user_id = db.Column(db.Integer, primary_key=True)
+    score = db.Column(db.Integer, nullable=False, default=0)
+    last_day = db.Column(db.Date, nullable=True)  # streak board: day of the latest completion
+
+
+for _model in (Task, PlatformStats):
+    for _event in ('after_insert', 'after_update', 'after_delete'):
+        event.listen(_model, _event, mark_data_changed)
+
+
+def count_platform_change(target, user_id, platform, delta):
+    """Add to the user's per-platform task delta for the current flush (None platform: unknown)"""
+    deltas = object_session(target).info.setdefault('platform_deltas', {})
+    user_delta = deltas.setdefault(user_id, {})
+    user_delta[platform] = user_delta.get(platform, 0) + delta
+
+
+@event.listens_for(Task, 'after_insert')
+def count_new_task(mapper, connection, target):
+    count_platform_change(target, target.user_id, target.platform, 1)
+
+
+@event.listens_for(Task, 'after_delete')
+def count_deleted_task(mapper, connection, target):
+    # An unloaded platform cannot be counted; the user's cached counts are dropped instead
+    count_platform_change(target, target.user_id, target.__dict__.get('platform'), -1)
+
+
+@event.listens_for(Task, 'after_update')
+def count_moved_task(mapper, connection, target):
+    state = inspect(target)
+    platform, owner = state.attrs.platform.history, state.attrs.user_id.history
+    if platform.has_changes() or owner.has_changes():
+        count_platform_change(target, (owner.deleted or [target.user_id])[0],
+                              (platform.deleted or [target.platform])[0], -1)
+        count_platform_change(target, target.user_id, target.platform, 1)
@@ -0,0 +1,208 @@
+import asyncio
+import random
+import threading
+import time
+from cache import TTLCache
+from instrumentation import record
+
+# Upstream answers worth retrying; anything else is returned to the caller
+RETRY_STATUSES = {429, 502, 503, 504}
+
+
+class CircuitOpen(Exception):
+    """Raised instead of calling a service whose circuit breaker is open"""
+
+
+class CircuitBreaker:
+    """Stops calling a service after repeated failures, then lets one probe through"""
+    
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+    
+    def allow(self):
+        """True if a request may go out now"""
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            # After the reset timeout a single probe decides whether to close again
+            if not self._probing and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._probing = True
+                return True
+            return False
+    
+    def success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+    
+    def release(self):
+        """Give up a probe slot without reporting success or failure"""
+        with self._lock:
+            self._probing = False
+    
+    def failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+                self._probing = False
+
+
+class OutboundClient:
+    """Shared settings and state for calls to external APIs.
+    
+    Request threads share one pooled httpx.Client from sync_client(). Async
+    clients are bound to an event loop, so async callers (the nightly sync)
+    open one per loop via client(). Breakers, the result cache and metrics
+    are shared by every request in the process.
+    """
+    
+    def __init__(self):
+        self.cache = TTLCache(ttl=60, maxsize=1024)
+        self._breakers = {}
+        self._sync_client = None
+        self._lock = threading.Lock()
+        self.configure()
+    
+    def configure(self, timeout=5, retries=2, backoff=0.25, failure_threshold=5,
+                  reset_timeout=30, cache_ttl=60):
+        """Apply app settings; resets breakers and cached results"""
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.cache.configure(ttl=cache_ttl)
+        with self._lock:
+            self._breakers = {}
+            client, self._sync_client = self._sync_client, None
+        if client is not None:
+            client.close()
+    
+    def breaker(self, service):
+        """The circuit breaker for a service, created on first use"""
+        with self._lock:
+            if service not in self._breakers:
+                self._breakers[service] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+            return self._breakers[service]
+    
+    def client(self, **kwargs):
+        """A new httpx.AsyncClient using the outbound timeout"""
+        import httpx
+        return httpx.AsyncClient(timeout=self.timeout, **kwargs)
+    
+    def sync_client(self):
+        """The process-wide httpx.Client, created on first use"""
+        import httpx
+        with self._lock:
+            if self._sync_client is None:
+                self._sync_client = httpx.Client(timeout=self.timeout)
+            return self._sync_client
+    
+    async def request(self, client, service, method, url, **kwargs):
+        """Send a request through the service's breaker with jittered retries.
+        
+        Raises CircuitOpen without touching the network while the breaker is
+        open, and the last httpx error once retries are exhausted. Timeouts
+        are raised at once: a hung upstream would otherwise hold the caller
+        for several full timeouts. Responses with a retryable status are
+        returned after the final attempt.
+        """
+        import httpx
+        
+        breaker = self.breaker(service)
+        for attempt in range(self.retries + 1):
+            self._admit(service, breaker)
+            
+            # Every attempt that passed allow() must settle with the breaker,
+            # or a half-open probe would block the service forever. Errors that
+            # say nothing about the service (cancellation, a bad URL) only
+            # give up the probe slot
+            started = time.monotonic()
+            response = None
+            failed = None
+            try:
+                response = await client.request(method, url, **kwargs)
+                failed = response.status_code in RETRY_STATUSES
+            except httpx.TransportError as e:
+                failed = True
+                if attempt == self.retries or isinstance(e, httpx.TimeoutException):
+                    raise
+            finally:
+                self._settle(service, breaker, started, failed)
+            
+            if not failed or attempt == self.retries:
+                return response
+            await asyncio.sleep(self._backoff(service, attempt))
+    
+    def request_sync(self, service, method, url, **kwargs):
+        """Blocking request() on the shared sync client, for request threads"""
+        import httpx
+        
+        client = self.sync_client()
+        breaker = self.breaker(service)
+        for attempt in range(self.retries + 1):
+            self._admit(service, breaker)
+            
+            started = time.monotonic()
+            response = None
+            failed = None
+            try:
+                response = client.request(method, url, **kwargs)
+                failed = response.status_code in RETRY_STATUSES
+            except httpx.TransportError as e:
+                failed = True
+                if attempt == self.retries or isinstance(e, httpx.TimeoutException):
+                    raise
+            finally:
+                self._settle(service, breaker, started, failed)
+            
+            if not failed or attempt == self.retries:
+                return response
+            time.sleep(self._backoff(service, attempt))
+    
+    def _admit(self, service, breaker):
+        if not breaker.allow():
+            record(f'outbound_{service}_rejected')
+            raise CircuitOpen(f'{service} is temporarily unavailable')
+    
+    def _settle(self, service, breaker, started, failed):
+        if failed is None:
+            breaker.release()
+        else:
+            self._finish(service, breaker, started, failed)
+    
+    def _backoff(self, service, attempt):
+        # Full jitter: sleep a random time up to the exponential backoff
+        record(f'outbound_{service}_retries')
+        return random.uniform(0, self.backoff * 2 ** attempt)
+    
+    def _finish(self, service, breaker, started, failed):
+        record(f'outbound_{service}_requests')
+        record(f'outbound_{service}_ms', round((time.monotonic() - started) * 1000))
+        if failed:
+            record(f'outbound_{service}_failures')
+            breaker.failure()
+        else:
+            breaker.success()
+
+
+outbound = OutboundClient()
+
+
+def init_outbound(app):
+    """Configure the shared outbound client from app config"""
+    outbound.configure(
+        timeout=app.config['OUTBOUND_TIMEOUT'],
+        retries=app.config['OUTBOUND_RETRIES'],
+        backoff=app.config['OUTBOUND_BACKOFF'],
+        failure_threshold=app.config['OUTBOUND_FAILURE_THRESHOLD'],
+        reset_timeout=app.config['OUTBOUND_RESET_TIMEOUT'],
+        cache_ttl=app.config['OUTBOUND_CACHE_TTL']
+    )
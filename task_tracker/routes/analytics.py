@@ -1,6 +1,12 @@
-from flask import Blueprint, render_template, jsonify
+from flask import Blueprint, render_template, jsonify, Response, current_app, abort
 from flask_login import login_required, current_user
 from models import db, Task, PlatformStats
+from events import broker, format_sse
+from http_cache import etag_by_data_version
+import leaderboards
+from archival import archived_weekday_counts
+import calendar
+import queue
 from datetime import datetime, timedelta
 from sqlalchemy import func
 from collections import defaultdict
@@ -22,8 +28,28 @@ def index():
     return render_template('dashboard.html', stats=stats, platform_data=platform_data)
 
 
+@analytics_bp.route('/leaderboard')
+@login_required
+def leaderboard():
+    """Team leaderboards with the current user's rank on each"""
+    size = current_app.config['LEADERBOARD_SIZE']
+    max_age = current_app.config['LEADERBOARD_REFRESH']
+    
+    boards = []
+    for key, title in leaderboards.BOARDS.items():
+        boards.append({
+            'key': key,
+            'title': title,
+            'top': leaderboards.top(key, size),
+            'me': leaderboards.my_rank(key, current_user.id, max_age)
+        })
+    
+    return render_template('leaderboard.html', boards=boards)
+
+
 @analytics_bp.route('/api/chart-data')
 @login_required
+@etag_by_data_version
 def chart_data():
     """API endpoint to get chart data for visualizations"""
     
@@ -47,9 +73,41 @@ def chart_data():
     })
 
 
+@analytics_bp.route('/events')
+@login_required
+def events():
+    """Server-Sent Events stream of dashboard deltas for the current user"""
+    if not current_app.config['SSE_ENABLED']:
+        abort(404)
+    
+    user_id = current_user.id
+    heartbeat = current_app.config['SSE_HEARTBEAT']
+    subscription = broker.subscribe(user_id)
+    
+    def stream():
+        try:
+            yield 'retry: 5000\n\n'
+            while True:
+                try:
+                    payload = subscription.get(timeout=heartbeat)
+                except queue.Empty:
+                    # Comment line keeps proxies from closing an idle stream
+                    yield ': keepalive\n\n'
+                    continue
+                yield format_sse(payload)
+        finally:
+            broker.unsubscribe(user_id, subscription)
+    
+    return Response(stream(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+
 def get_weekly_completion_data():
     """Get tasks completed per week for the last 7 weeks"""
     weeks = []
+    starts = []
     completed_counts = []
     
     today = datetime.utcnow().date()
@@ -66,29 +124,24 @@ def get_weekly_completion_data():
         ).count()
         
         weeks.append(f"Week {7-i}")
+        starts.append(week_start.isoformat())
         completed_counts.append(count)
     
     return {
         'labels': weeks,
+        'starts': starts,
         'data': completed_counts
     }
 
 
 def get_platform_distribution():
-    """Get task distribution across platforms"""
-    platform_counts = db.session.query(
-        Task.platform,
-        func.count(Task.id)
-    ).filter(
-        Task.user_id == current_user.id
-    ).group_by(Task.platform).all()
-    
-    platforms = [p[0] for p in platform_counts]
-    counts = [p[1] for p in platform_counts]
+    """Get task distribution across platforms, including archived completions"""
+    counts = current_user.get_platform_counts()
+    platforms = sorted(counts)
     
     return {
         'labels': platforms,
-        'data': counts
+        'data': [counts[p]['tasks'] + counts[p]['archived'] for p in platforms]
     }
 
 
@@ -133,20 +186,19 @@ def generate_productivity_insights():
             day_name = task.completed_at.strftime('%A')
             day_counts[day_name] += 1
     
+    for weekday, count in archived_weekday_counts(current_user.id).items():
+        day_counts[calendar.day_name[weekday]] += count
+    
     if day_counts:
         most_productive_day = max(day_counts, key=day_counts.get)
         insights.append(f"You're most productive on {most_productive_day}s!")
     
     # Analyze favorite platform
-    platform_counts = db.session.query(
-        Task.platform,
-        func.count(Task.id)
-    ).filter(
-        Task.user_id == current_user.id
-    ).group_by(Task.platform).order_by(func.count(Task.id).desc()).first()
-    
-    if platform_counts:
-        insights.append(f"Your most used platform is {platform_counts[0]} with {platform_counts[1]} tasks.")
+    distribution = get_platform_distribution()
+    if distribution['data']:
+        top_count = max(distribution['data'])
+        top_platform = distribution['labels'][distribution['data'].index(top_count)]
+        insights.append(f"Your most used platform is {top_platform} with {top_count} tasks.")
     
     # Calculate current streak
     streak = calculate_streak()
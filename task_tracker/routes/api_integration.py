@@ -1,8 +1,11 @@
-from flask import Blueprint, jsonify, flash, redirect, url_for, request
+from flask import Blueprint, jsonify, flash, redirect, url_for, request, current_app
 from flask_login import login_required, current_user
 from models import db, PlatformStats
-import requests
+from events import broker
+from http_cache import etag_by_data_version
+from outbound import outbound, CircuitOpen
 from datetime import datetime
+import asyncio
 
 api_bp = Blueprint('api', __name__, url_prefix='/api')
 
@@ -11,31 +14,19 @@ api_bp = Blueprint('api', __name__, url_prefix='/api')
 @login_required
 def sync_platform(platform):
     """Sync data from external platform APIs"""
+    if platform not in ('github', 'leetcode'):
+        return jsonify({'error': 'Unsupported platform'}), 400
+    
+    # Get the platform username from the request
+    username = request.args.get('username') or request.form.get('username')
     
     if platform == 'github':
-        success, data = fetch_github_stats()
-    elif platform == 'leetcode':
-        success, data = fetch_leetcode_stats()
+        success, data = get_github_stats(username)
     else:
-        return jsonify({'error': 'Unsupported platform'}), 400
+        success, data = get_leetcode_stats(username)
     
     if success:
-        # Store or update platform stats
-        platform_stat = PlatformStats.query.filter_by(
-            user_id=current_user.id,
-            platform=platform
-        ).first()
-        
-        if platform_stat:
-            platform_stat.set_data(data)
-        else:
-            platform_stat = PlatformStats(
-                user_id=current_user.id,
-                platform=platform
-            )
-            platform_stat.set_data(data)
-            db.session.add(platform_stat)
-        
+        save_platform_stats(current_user.id, platform, data)
         db.session.commit()
         
         return jsonify({
@@ -50,89 +41,160 @@ def sync_platform(platform):
         }), 500
 
 
-def fetch_github_stats():
-    """Fetch GitHub statistics using GitHub API"""
+def save_platform_stats(user_id, platform, data):
+    """Store or update a user's platform stats in the current transaction"""
+    platform_stat = PlatformStats.query.filter_by(
+        user_id=user_id,
+        platform=platform
+    ).first()
+    
+    if platform_stat:
+        platform_stat.set_data(data)
+    else:
+        platform_stat = PlatformStats(
+            user_id=user_id,
+            platform=platform
+        )
+        platform_stat.set_data(data)
+        db.session.add(platform_stat)
+    
+    broker.publish(user_id, 'platform', {'platform': platform, 'data': data})
+    return platform_stat
+
+
+def github_requests(github_username):
+    """URLs of the user, repositories and recent events calls, plus headers"""
+    api_url = current_app.config['GITHUB_API_URL']
+    urls = [
+        f'{api_url}/users/{github_username}',
+        f'{api_url}/users/{github_username}/repos?sort=updated&per_page=10',
+        f'{api_url}/users/{github_username}/events/public?per_page=10',
+    ]
+    headers = {}
+    
+    # Add token if available (for higher rate limits)
+    github_token = current_app.config.get('GITHUB_TOKEN')
+    if github_token:
+        headers['Authorization'] = f'token {github_token}'
+    return urls, headers
+
+
+def github_result(github_username, user_response, repos_response, events_response):
+    """Turn the three GitHub responses into a (success, data) result.
+    
+    Repositories and events are optional, so their failures may be passed
+    in as exceptions; a failed user call is raised.
+    """
+    if isinstance(user_response, Exception):
+        raise user_response
+    
+    if user_response.status_code != 200:
+        return False, f'GitHub API error: {user_response.status_code}'
+    
+    user_data = user_response.json()
+    repos_data = optional_json(repos_response)
+    events_data = optional_json(events_response)
+    
+    stats = build_github_stats(github_username, user_data, repos_data or [], events_data or [])
+    # Only complete profiles are reused
+    if repos_data is not None and events_data is not None:
+        outbound.cache.set(('github', github_username), stats)
+    return True, stats
+
+
+def fetch_failed(service, error):
+    """The (success, data) result reported for an exception while fetching"""
+    import httpx
+    
+    if isinstance(error, CircuitOpen):
+        return False, f'{service} is not responding, please try again in a minute'
+    if isinstance(error, httpx.HTTPError):
+        return False, f'Network error: {str(error)}'
+    return False, f'Error fetching {service} stats: {str(error)}'
+
+
+def get_github_stats(github_username):
+    """Fetch GitHub statistics on the request thread, one call after another"""
+    if not github_username:
+        return False, 'GitHub username not provided'
+    
+    # Recently fetched profiles are served from the short-lived cache
+    cached = outbound.cache.get(('github', github_username))
+    if cached is not None:
+        return True, cached
+    
     try:
-        # Get GitHub username from request or use a default
-        github_username = request.args.get('username') or request.form.get('username')
-        
-        if not github_username:
-            return False, 'GitHub username not provided'
-        
-        # Fetch user data
-        user_url = f'https://api.github.com/users/{github_username}'
-        headers = {}
-        
-        # Add token if available (for higher rate limits)
-        from flask import current_app
-        github_token = current_app.config.get('GITHUB_TOKEN')
-        if github_token:
-            headers['Authorization'] = f'token {github_token}'
-        
-        user_response = requests.get(user_url, headers=headers, timeout=10)
-        
+        (user_url, *optional_urls), headers = github_requests(github_username)
+        user_response = outbound.request_sync('github', 'GET', user_url, headers=headers)
         if user_response.status_code != 200:
-            return False, f'GitHub API error: {user_response.status_code}'
-        
-        user_data = user_response.json()
+            return github_result(github_username, user_response, None, None)
         
-        # Fetch repositories
-        repos_url = f'https://api.github.com/users/{github_username}/repos?sort=updated&per_page=10'
-        repos_response = requests.get(repos_url, headers=headers, timeout=10)
-        
-        repos_data = repos_response.json() if repos_response.status_code == 200 else []
-        
-        # Fetch recent events (commits, etc.)
-        events_url = f'https://api.github.com/users/{github_username}/events/public?per_page=10'
-        events_response = requests.get(events_url, headers=headers, timeout=10)
-        
-        events_data = events_response.json() if events_response.status_code == 200 else []
-        
-        # Process and structure the data
-        github_stats = {
-            'username': github_username,
-            'name': user_data.get('name', 'N/A'),
-            'public_repos': user_data.get('public_repos', 0),
-            'followers': user_data.get('followers', 0),
-            'following': user_data.get('following', 0),
-            'total_stars': sum(repo.get('stargazers_count', 0) for repo in repos_data),
-            'recent_repos': [
-                {
-                    'name': repo.get('name'),
-                    'description': repo.get('description', 'No description'),
-                    'stars': repo.get('stargazers_count', 0),
-                    'language': repo.get('language', 'N/A'),
-                    'updated_at': repo.get('updated_at')
-                }
-                for repo in repos_data[:5]
-            ],
-            'recent_commits': len([e for e in events_data if e.get('type') == 'PushEvent']),
-            'last_updated': datetime.utcnow().isoformat()
-        }
-        
-        return True, github_stats
-        
-    except requests.exceptions.RequestException as e:
-        return False, f'Network error: {str(e)}'
+        optional_responses = []
+        for url in optional_urls:
+            try:
+                optional_responses.append(outbound.request_sync('github', 'GET', url, headers=headers))
+            except Exception as e:
+                optional_responses.append(e)
+        return github_result(github_username, user_response, *optional_responses)
     except Exception as e:
-        return False, f'Error fetching GitHub stats: {str(e)}'
+        return fetch_failed('GitHub', e)
 
 
-def fetch_leetcode_stats():
-    """Fetch LeetCode statistics using unofficial API"""
+async def fetch_github_stats(client, github_username):
+    """Fetch GitHub statistics with the three calls made concurrently"""
+    if not github_username:
+        return False, 'GitHub username not provided'
+    
+    cached = outbound.cache.get(('github', github_username))
+    if cached is not None:
+        return True, cached
+    
     try:
-        # Get LeetCode username from request
-        leetcode_username = request.args.get('username') or request.form.get('username')
-        
-        if not leetcode_username:
-            return False, 'LeetCode username not provided'
-        
-        # Use LeetCode GraphQL API
-        url = 'https://leetcode.com/graphql'
-        
-        query = """
-        query getUserProfile($username: String!) {
-            matchedUser(username: $username) {
+        # Optional failures are returned rather than raised (a half-open
+        # breaker only lets the first call through)
+        urls, headers = github_requests(github_username)
+        responses = await asyncio.gather(
+            *(outbound.request(client, 'github', 'GET', url, headers=headers) for url in urls),
+            return_exceptions=True
+        )
+        return github_result(github_username, *responses)
+    except Exception as e:
+        return fetch_failed('GitHub', e)
+
+
+def optional_json(response):
+    """JSON body of a successful optional call, or None if it failed"""
+    if response is None or isinstance(response, Exception) or response.status_code != 200:
+        return None
+    return response.json()
+
+
+def build_github_stats(github_username, user_data, repos_data, events_data):
+    """Process and structure raw GitHub API responses"""
+    return {
+        'username': github_username,
+        'name': user_data.get('name', 'N/A'),
+        'public_repos': user_data.get('public_repos', 0),
+        'followers': user_data.get('followers', 0),
+        'following': user_data.get('following', 0),
+        'total_stars': sum(repo.get('stargazers_count', 0) for repo in repos_data),
+        'recent_repos': [
+            {
+                'name': repo.get('name'),
+                'description': repo.get('description', 'No description'),
+                'stars': repo.get('stargazers_count', 0),
+                'language': repo.get('language', 'N/A'),
+                'updated_at': repo.get('updated_at')
+            }
+            for repo in repos_data[:5]
+        ],
+        'recent_commits': len([e for e in events_data if e.get('type') == 'PushEvent']),
+        'last_updated': datetime.utcnow().isoformat()
+    }
+
+
+# Fields requested from the LeetCode GraphQL API (LEETCODE_GRAPHQL_URL)
+LEETCODE_USER_FIELDS = """
                 username
                 profile {
                     ranking
@@ -144,64 +206,88 @@ def fetch_leetcode_stats():
                         count
                     }
                 }
-            }
-        }
-        """
-        
-        response = requests.post(
-            url,
-            json={'query': query, 'variables': {'username': leetcode_username}},
-            headers={'Content-Type': 'application/json'},
-            timeout=10
+"""
+
+
+def leetcode_request(leetcode_username):
+    """Keyword arguments of the profile GraphQL call"""
+    query = """
+    query getUserProfile($username: String!) {
+        matchedUser(username: $username) {%s}
+    }
+    """ % LEETCODE_USER_FIELDS
+    return {
+        'json': {'query': query, 'variables': {'username': leetcode_username}},
+        'headers': {'Content-Type': 'application/json'},
+    }
+
+
+def leetcode_result(leetcode_username, response):
+    """Turn the GraphQL response into a (success, data) result"""
+    if response.status_code != 200:
+        return False, f'LeetCode API error: {response.status_code}'
+    
+    data = response.json()
+    
+    if 'errors' in data or not data.get('data', {}).get('matchedUser'):
+        return False, 'User not found or API error'
+    
+    stats = build_leetcode_stats(leetcode_username, data['data']['matchedUser'])
+    outbound.cache.set(('leetcode', leetcode_username), stats)
+    return True, stats
+
+
+def get_leetcode_stats(leetcode_username):
+    """Fetch LeetCode statistics on the request thread"""
+    if not leetcode_username:
+        return False, 'LeetCode username not provided'
+    
+    cached = outbound.cache.get(('leetcode', leetcode_username))
+    if cached is not None:
+        return True, cached
+    
+    try:
+        response = outbound.request_sync(
+            'leetcode', 'POST', current_app.config['LEETCODE_GRAPHQL_URL'], **leetcode_request(leetcode_username)
         )
-        
-        if response.status_code != 200:
-            return False, f'LeetCode API error: {response.status_code}'
-        
-        data = response.json()
-        
-        if 'errors' in data or not data.get('data', {}).get('matchedUser'):
-            return False, 'User not found or API error'
-        
-        user_data = data['data']['matchedUser']
-        
-        # Process submission stats
-        submission_stats = user_data.get('submitStats', {}).get('acSubmissionNum', [])
-        
-        problems_solved = {
-            'total': 0,
-            'easy': 0,
-            'medium': 0,
-            'hard': 0
-        }
-        
-        for stat in submission_stats:
-            difficulty = stat.get('difficulty', '').lower()
-            count = stat.get('count', 0)
-            
-            if difficulty == 'all':
-                problems_solved['total'] = count
-            elif difficulty in problems_solved:
-                problems_solved[difficulty] = count
-        
-        leetcode_stats = {
-            'username': leetcode_username,
-            'ranking': user_data.get('profile', {}).get('ranking', 'N/A'),
-            'reputation': user_data.get('profile', {}).get('reputation', 0),
-            'problems_solved': problems_solved,
-            'last_updated': datetime.utcnow().isoformat()
-        }
-        
-        return True, leetcode_stats
-        
-    except requests.exceptions.RequestException as e:
-        return False, f'Network error: {str(e)}'
+        return leetcode_result(leetcode_username, response)
     except Exception as e:
-        return False, f'Error fetching LeetCode stats: {str(e)}'
+        return fetch_failed('LeetCode', e)
+
+
+def build_leetcode_stats(leetcode_username, user_data):
+    """Process a matchedUser GraphQL result"""
+    # Process submission stats
+    submission_stats = user_data.get('submitStats', {}).get('acSubmissionNum', [])
+    
+    problems_solved = {
+        'total': 0,
+        'easy': 0,
+        'medium': 0,
+        'hard': 0
+    }
+    
+    for stat in submission_stats:
+        difficulty = stat.get('difficulty', '').lower()
+        count = stat.get('count', 0)
+        
+        if difficulty == 'all':
+            problems_solved['total'] = count
+        elif difficulty in problems_solved:
+            problems_solved[difficulty] = count
+    
+    return {
+        'username': leetcode_username,
+        'ranking': user_data.get('profile', {}).get('ranking', 'N/A'),
+        'reputation': user_data.get('profile', {}).get('reputation', 0),
+        'problems_solved': problems_solved,
+        'last_updated': datetime.utcnow().isoformat()
+    }
 
 
 @api_bp.route('/platform-stats')
 @login_required
+@etag_by_data_version
 def get_platform_stats():
     """Get all platform stats for current user"""
     platform_stats = PlatformStats.query.filter_by(user_id=current_user.id).all()
@@ -1,13 +1,17 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request
+import threading
+import time
+from flask import Blueprint, render_template, redirect, url_for, flash, request, session, current_app, jsonify
 from flask_login import login_user, logout_user, login_required, current_user
-from flask_bcrypt import Bcrypt
 from flask_wtf import FlaskForm
 from wtforms import StringField, PasswordField, SubmitField
-from wtforms.validators import DataRequired, Email, Length, EqualTo, ValidationError
+from wtforms.validators import DataRequired, Email, Length, EqualTo
+from sqlalchemy.exc import IntegrityError
 from models import db, User
+from cache import BloomFilter
+from security import bcrypt, password_hasher, login_allowed, HashingBusy, remember_identity, forget_identity
+from sharding import shards
 
 auth_bp = Blueprint('auth', __name__, url_prefix='/auth')
-bcrypt = Bcrypt()
 
 # Forms
 class RegistrationForm(FlaskForm):
@@ -30,17 +34,10 @@ class RegistrationForm(FlaskForm):
     ])
     submit = SubmitField('Register')
     
-    def validate_username(self, username):
-        """Check if username already exists"""
-        user = User.query.filter_by(username=username.data).first()
-        if user:
-            raise ValidationError('Username already taken. Please choose a different one.')
-    
-    def validate_email(self, email):
-        """Check if email already exists"""
-        user = User.query.filter_by(email=email.data).first()
-        if user:
-            raise ValidationError('Email already registered. Please use a different one.')
+    # Uniqueness is enforced by the unique indexes on users.username and
+    # users.email; register() maps the IntegrityError back to these messages
+    USERNAME_TAKEN = 'Username already taken. Please choose a different one.'
+    EMAIL_TAKEN = 'Email already registered. Please use a different one.'
 
 
 class LoginForm(FlaskForm):
@@ -53,6 +50,37 @@ class LoginForm(FlaskForm):
     submit = SubmitField('Login')
 
 
+# Filter over existing usernames for the availability check. It is per
+# process and only sees names registered here since the last rebuild, so a
+# name taken through another worker can look free for USERNAME_FILTER_TTL
+_username_filter = {'bloom': None, 'built_at': 0}
+_username_filter_lock = threading.Lock()
+
+
+def get_username_filter():
+    """Return the username Bloom filter, rebuilding it once it is stale.
+    
+    One thread rebuilds while the others keep using the previous filter.
+    """
+    ttl = current_app.config['USERNAME_FILTER_TTL']
+    bloom = _username_filter['bloom']
+    if bloom is not None and time.monotonic() - _username_filter['built_at'] <= ttl:
+        return bloom
+    if not _username_filter_lock.acquire(blocking=bloom is None):
+        return bloom
+    try:
+        if _username_filter['bloom'] is bloom:
+            count = db.session.query(User.id).count()
+            bloom = BloomFilter(capacity=max(count * 2, 1024), error_rate=0.0001)
+            for (username,) in db.session.query(User.username).yield_per(1000):
+                bloom.add(username)
+            _username_filter['bloom'] = bloom
+            _username_filter['built_at'] = time.monotonic()
+        return _username_filter['bloom']
+    finally:
+        _username_filter_lock.release()
+
+
 # Routes
 @auth_bp.route('/register', methods=['GET', 'POST'])
 def register():
@@ -63,17 +91,33 @@ def register():
     form = RegistrationForm()
     if form.validate_on_submit():
         # Hash the password
-        hashed_password = bcrypt.generate_password_hash(form.password.data).decode('utf-8')
+        try:
+            hashed_password = password_hasher.hash(form.password.data)
+        except HashingBusy:
+            flash('The server is busy. Please try again in a moment.', 'warning')
+            return render_template('register.html', form=form), 503
         
         # Create new user
         user = User(
             username=form.username.data,
             email=form.email.data,
-            password_hash=hashed_password
+            password_hash=hashed_password,
+            shard=shards.pick_shard()
         )
         
         db.session.add(user)
-        db.session.commit()
+        try:
+            db.session.commit()
+        except IntegrityError as e:
+            db.session.rollback()
+            if 'email' in str(e.orig).lower():
+                form.email.errors.append(form.EMAIL_TAKEN)
+            else:
+                form.username.errors.append(form.USERNAME_TAKEN)
+            return render_template('register.html', form=form)
+        
+        if _username_filter['bloom'] is not None:
+            _username_filter['bloom'].add(user.username)
         
         flash('Account created successfully! You can now log in.', 'success')
         return redirect(url_for('auth.login'))
@@ -81,6 +125,24 @@ def register():
     return render_template('register.html', form=form)
 
 
+@auth_bp.route('/check-username')
+def check_username():
+    """Report whether a username is free, skipping the DB for names never seen"""
+    username = request.args.get('username', '').strip()
+    if not 3 <= len(username) <= 80:
+        return jsonify({'available': False, 'error': 'Username must be between 3 and 80 characters'})
+    
+    # A miss means the name did not exist at the last rebuild and was not
+    # registered here since, which is the common case and needs no query.
+    # A hit may be a false positive, so confirm it. Registration's unique
+    # constraint stays the real check for names taken by other workers
+    if username not in get_username_filter():
+        return jsonify({'available': True})
+    
+    taken = db.session.query(User.id).filter_by(username=username).first() is not None
+    return jsonify({'available': not taken})
+
+
 @auth_bp.route('/login', methods=['GET', 'POST'])
 def login():
     """Handle user login"""
@@ -89,10 +151,30 @@ def login():
     
     form = LoginForm()
     if form.validate_on_submit():
+        if not login_allowed(request.remote_addr, form.email.data):
+            flash('Too many login attempts. Please wait a minute and try again.', 'danger')
+            return render_template('login.html', form=form), 429
+        
         user = User.query.filter_by(email=form.email.data).first()
         
-        if user and bcrypt.check_password_hash(user.password_hash, form.password.data):
+        try:
+            valid = user is not None and password_hasher.check(user.password_hash, form.password.data)
+        except HashingBusy:
+            flash('The server is busy. Please try again in a moment.', 'warning')
+            return render_template('login.html', form=form), 503
+        
+        if valid:
+            # Upgrade hashes made with an older work factor
+            if password_hasher.needs_rehash(user.password_hash):
+                try:
+                    user.password_hash = password_hasher.hash(form.password.data)
+                    db.session.commit()
+                except HashingBusy:
+                    pass
+            
             login_user(user, remember=True)
+            if current_app.config['USER_SESSION_IDENTITY']:
+                remember_identity(user)
             next_page = request.args.get('next')
             flash(f'Welcome back, {user.username}!', 'success')
             return redirect(next_page) if next_page else redirect(url_for('dashboard.index'))
@@ -107,5 +189,6 @@ def login():
 def logout():
     """Handle user logout"""
     logout_user()
+    forget_identity()
     flash('You have been logged out successfully.', 'info')
     return redirect(url_for('auth.login'))
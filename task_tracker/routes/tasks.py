@@ -1,10 +1,14 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify
+from flask import Blueprint, render_template, stream_template, redirect, url_for, flash, request, jsonify, current_app, abort
 from flask_login import login_required, current_user
 from flask_wtf import FlaskForm
 from wtforms import StringField, TextAreaField, SelectField, SubmitField
 from wtforms.validators import DataRequired, Length
-from models import db, Task
+from models import db, Task, ArchivedTask
+from events import broker
+from batching import ToggleBatcher
+from concurrent.futures import TimeoutError as FutureTimeout
 from datetime import datetime
+import heapq
 
 tasks_bp = Blueprint('tasks', __name__, url_prefix='/tasks')
 
@@ -41,6 +45,7 @@ def index():
     # Get filter parameters
     status_filter = request.args.get('status', 'all')
     platform_filter = request.args.get('platform', 'all')
+    include_archived = request.args.get('archived') == '1'
     
     # Base query
     query = Task.query.filter_by(user_id=current_user.id)
@@ -51,18 +56,33 @@ def index():
     if platform_filter != 'all':
         query = query.filter_by(platform=platform_filter)
     
-    # Order by creation date (newest first)
-    tasks = query.order_by(Task.created_at.desc()).all()
-    
-    # Get unique platforms for filter dropdown
-    platforms = db.session.query(Task.platform).filter_by(user_id=current_user.id).distinct().all()
-    platforms = [p[0] for p in platforms]
-    
-    return render_template('tasks.html', 
-                         tasks=tasks, 
-                         platforms=platforms,
-                         current_status=status_filter,
-                         current_platform=platform_filter)
+    # Order by creation date (newest first); rows are fetched in chunks
+    # while the template streams instead of being loaded up front
+    chunk_size = current_app.config['TASK_LIST_CHUNK_SIZE']
+    tasks = query.order_by(Task.created_at.desc()).yield_per(chunk_size)
+    
+    # Archived tasks are all completed and may live in another database,
+    # so query them separately and merge by creation date
+    if include_archived and status_filter in ('all', 'completed'):
+        archived_query = ArchivedTask.query.filter_by(user_id=current_user.id)
+        if platform_filter != 'all':
+            archived_query = archived_query.filter_by(platform=platform_filter)
+        archived = archived_query.order_by(ArchivedTask.created_at.desc()).yield_per(chunk_size)
+        tasks = heapq.merge(tasks, archived, key=lambda t: t.created_at, reverse=True)
+    
+    # Platforms with task counts for the filter dropdown
+    platforms = []
+    for platform, counts in sorted(current_user.get_platform_counts().items()):
+        count = counts['tasks'] + (counts['archived'] if include_archived else 0)
+        if count:
+            platforms.append((platform, count))
+    
+    return stream_template('tasks.html', 
+                           tasks=tasks, 
+                           platforms=platforms,
+                           current_status=status_filter,
+                           current_platform=platform_filter,
+                           include_archived=include_archived)
 
 
 @tasks_bp.route('/add', methods=['GET', 'POST'])
@@ -81,6 +101,11 @@ def add():
         )
         
         db.session.add(task)
+        broker.publish(current_user.id, 'task', {
+            'action': 'added',
+            'platform': task.platform,
+            'status': task.status
+        })
         db.session.commit()
         
         flash('Task added successfully!', 'success')
@@ -103,6 +128,13 @@ def edit(task_id):
     form = TaskForm(obj=task)
     
     if form.validate_on_submit():
+        if task.platform != form.platform.data:
+            broker.publish(current_user.id, 'task', {
+                'action': 'moved',
+                'old_platform': task.platform,
+                'platform': form.platform.data
+            })
+        
         task.title = form.title.data
         task.description = form.description.data
         task.platform = form.platform.data
@@ -127,6 +159,12 @@ def delete(task_id):
         return redirect(url_for('tasks.index'))
     
     db.session.delete(task)
+    broker.publish(current_user.id, 'task', {
+        'action': 'deleted',
+        'platform': task.platform,
+        'status': task.status,
+        'completed_at': task.completed_at.strftime('%Y-%m-%d %H:%M:%S') if task.completed_at else None
+    })
     db.session.commit()
     
     flash('Task deleted successfully!', 'success')
@@ -136,18 +174,66 @@ def delete(task_id):
 @tasks_bp.route('/toggle/<int:task_id>', methods=['POST'])
 @login_required
 def toggle(task_id):
-    """Toggle task completion status"""
+    """Toggle task completion status.
+    
+    Clients send the status they want ({"status": "completed"}), so a retry
+    after a timeout cannot undo a toggle that committed late; without one
+    the status is flipped.
+    """
+    status = (request.get_json(silent=True) or {}).get('status')
+    if status not in (None, 'pending', 'completed'):
+        return jsonify({'error': 'Unknown status'}), 400
+    
+    if toggle_batcher.enabled:
+        # Share a transaction with toggles from other requests; if the writer
+        # is backed up the toggle is withdrawn and applied directly below
+        try:
+            batched = toggle_batcher.submit(task_id, current_user.id, status)
+        except FutureTimeout:
+            return jsonify({'error': 'The server is busy. Please try again in a moment.'}), 503
+        if batched is not None:
+            outcome, result = batched
+            if outcome == 'not_found':
+                abort(404)
+            if outcome == 'forbidden':
+                return jsonify({'error': 'Unauthorized'}), 403
+            if outcome == 'moving':
+                return jsonify({'error': 'Your data is being moved. Please try again in a moment.'}), 503
+            return jsonify(dict(result, success=True))
+    
     task = Task.query.get_or_404(task_id)
     
     # Ensure the task belongs to the current user
     if task.user_id != current_user.id:
         return jsonify({'error': 'Unauthorized'}), 403
     
-    task.toggle_status()
+    result = apply_toggle(task, status)
     db.session.commit()
     
-    return jsonify({
-        'success': True,
+    return jsonify(dict(result, success=True))
+
+
+def apply_toggle(task, status=None):
+    """Move a task to status (flip it when None) and queue its dashboard delta; the caller commits"""
+    previous_status = task.status
+    previous_completed_at = task.completed_at
+    if status is None:
+        task.toggle_status()
+    else:
+        task.set_status(status)
+    completed_at = task.completed_at.strftime('%Y-%m-%d %H:%M:%S') if task.completed_at else None
+    if task.status != previous_status:
+        broker.publish(task.user_id, 'task', {
+            'action': 'toggled',
+            'platform': task.platform,
+            'status': task.status,
+            'completed_at': completed_at,
+            'previous_completed_at': previous_completed_at.strftime('%Y-%m-%d %H:%M:%S') if previous_completed_at else None
+        })
+    return {
         'status': task.status,
-        'completed_at': task.completed_at.strftime('%Y-%m-%d %H:%M:%S') if task.completed_at else None
-    })
+        'completed_at': completed_at
+    }
+
+
+toggle_batcher = ToggleBatcher(apply_toggle)
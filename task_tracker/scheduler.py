@@ -0,0 +1,163 @@
+import asyncio
+import time
+from flask import current_app
+from models import db, PlatformStats
+from events import broker
+from outbound import outbound, CircuitOpen
+from sharding import shards
+from routes.api_integration import fetch_github_stats, build_leetcode_stats, LEETCODE_USER_FIELDS
+
+
+class HostLimiter:
+    """Bounded concurrency plus a minimum spacing between request starts for one host"""
+    
+    def __init__(self, concurrency, rate_per_second):
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._interval = 1.0 / rate_per_second if rate_per_second > 0 else 0
+        self._next_start = 0.0
+        self._lock = asyncio.Lock()
+    
+    async def __aenter__(self):
+        await self._semaphore.acquire()
+        async with self._lock:
+            now = time.monotonic()
+            wait = self._next_start - now
+            self._next_start = max(now, self._next_start) + self._interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+    
+    async def __aexit__(self, *exc):
+        self._semaphore.release()
+
+
+def build_leetcode_batch_query(count):
+    """One GraphQL query fetching several users through aliases u0..uN"""
+    params = ', '.join(f'$u{i}: String!' for i in range(count))
+    fields = ' '.join(f'u{i}: matchedUser(username: $u{i}) {{{LEETCODE_USER_FIELDS}}}' for i in range(count))
+    return f'query batchUserProfiles({params}) {{ {fields} }}'
+
+
+async def fetch_leetcode_batch(client, limiter, usernames):
+    """Fetch several LeetCode users in a single request; returns {username: (success, data)}"""
+    import httpx
+    
+    try:
+        async with limiter:
+            response = await outbound.request(
+                client, 'leetcode', 'POST', current_app.config['LEETCODE_GRAPHQL_URL'],
+                json={
+                    'query': build_leetcode_batch_query(len(usernames)),
+                    'variables': {f'u{i}': name for i, name in enumerate(usernames)}
+                },
+                headers={'Content-Type': 'application/json'}
+            )
+        if response.status_code != 200:
+            return {name: (False, f'LeetCode API error: {response.status_code}') for name in usernames}
+        data = response.json().get('data') or {}
+    except CircuitOpen as e:
+        return {name: (False, str(e)) for name in usernames}
+    except (httpx.HTTPError, ValueError) as e:
+        return {name: (False, f'Network error: {str(e)}') for name in usernames}
+    
+    results = {}
+    for i, name in enumerate(usernames):
+        user_data = data.get(f'u{i}')
+        if user_data:
+            results[name] = (True, build_leetcode_stats(name, user_data))
+        else:
+            results[name] = (False, 'User not found or API error')
+    return results
+
+
+async def fetch_github_limited(client, limiter, username):
+    async with limiter:
+        return username, await fetch_github_stats(client, username)
+
+
+async def fetch_all(github_usernames, leetcode_usernames, settings):
+    """Fan out all platform fetches with per-host concurrency and rate limits"""
+    import httpx
+    
+    github_limiter = HostLimiter(settings['concurrency'], settings['github_rate'])
+    leetcode_limiter = HostLimiter(settings['concurrency'], settings['leetcode_rate'])
+    batch_size = settings['leetcode_batch_size']
+    
+    limits = httpx.Limits(max_connections=settings['concurrency'] * 2)
+    async with outbound.client(limits=limits) as client:
+        github_jobs = [fetch_github_limited(client, github_limiter, name) for name in github_usernames]
+        leetcode_jobs = [
+            fetch_leetcode_batch(client, leetcode_limiter, leetcode_usernames[i:i + batch_size])
+            for i in range(0, len(leetcode_usernames), batch_size)
+        ]
+        github_results, leetcode_batches = await asyncio.gather(
+            asyncio.gather(*github_jobs),
+            asyncio.gather(*leetcode_jobs)
+        )
+    
+    leetcode_results = {}
+    for batch in leetcode_batches:
+        leetcode_results.update(batch)
+    return {'github': dict(github_results), 'leetcode': leetcode_results}
+
+
+def sync_all_platforms(settings, report=print):
+    """Refresh every stored GitHub and LeetCode profile; call inside an app context"""
+    started = time.monotonic()
+    
+    # Each PlatformStats row remembers the username it was last synced with;
+    # the shards are read in parallel
+    owners = {'github': {}, 'leetcode': {}}
+    
+    def synced_profiles(shard):
+        rows = PlatformStats.query.filter(PlatformStats.platform.in_(list(owners))).yield_per(1000)
+        return [(stat.platform, stat.get_data().get('username'), stat.id, stat.user_id) for stat in rows]
+    
+    for shard, profiles in shards.fan_out(synced_profiles).items():
+        for platform, username, stat_id, user_id in profiles:
+            if username:
+                owners[platform].setdefault(username, []).append((shard, stat_id, user_id))
+    
+    report(f"Syncing {len(owners['github'])} GitHub and {len(owners['leetcode'])} LeetCode profiles")
+    results = asyncio.run(fetch_all(list(owners['github']), list(owners['leetcode']), settings))
+    
+    updated, failed = 0, 0
+    writes = {shard: [] for shard in shards.all()}
+    for platform, by_username in results.items():
+        for username, (success, data) in by_username.items():
+            if not success:
+                failed += 1
+                report(f'  {platform} {username}: {data}')
+                continue
+            for shard, stat_id, user_id in owners[platform][username]:
+                writes[shard].append((platform, stat_id, user_id, data))
+    
+    # Write results shard by shard, write_batch_size rows per transaction
+    batch_size = settings['write_batch_size']
+    for shard, items in writes.items():
+        with shards.using(shard):
+            for start in range(0, len(items), batch_size):
+                write_stats_batch(items[start:start + batch_size])
+                db.session.commit()
+                updated += len(items[start:start + batch_size])
+    
+    report(f'Updated {updated} rows, {failed} profiles failed, in {time.monotonic() - started:.1f}s')
+    return updated, failed
+
+
+def write_stats_batch(items):
+    """Update a batch of (platform, stat_id, user_id, data) rows in one flush.
+    
+    The rows are loaded with one query and changed through the ORM, so the
+    mapper events advance data versions and LeetCode scores exactly as for a
+    single save; the flush sends the UPDATEs as one executemany.
+    """
+    stats = PlatformStats.query.filter(PlatformStats.id.in_([stat_id for _, stat_id, _, _ in items]))
+    by_id = {stat.id: stat for stat in stats}
+    for platform, stat_id, user_id, data in items:
+        stat = by_id.get(stat_id)
+        if stat is None:
+            # Deleted since the profiles were read
+            continue
+        stat.set_data(data)
+        broker.publish(user_id, 'platform', {'platform': platform, 'data': data})
+    db.session.flush()
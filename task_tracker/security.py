@@ -0,0 +1,147 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from flask import session
+from flask_bcrypt import Bcrypt
+from werkzeug.middleware.proxy_fix import ProxyFix
+
+bcrypt = Bcrypt()
+
+
+class HashingBusy(Exception):
+    """Raised when the password hashing pool is saturated"""
+
+
+class PasswordHasher:
+    """Runs bcrypt in a small bounded pool so logins cannot starve other requests"""
+    
+    def __init__(self, rounds=12, workers=2, queue_size=8, timeout=10):
+        self._executor = None
+        self.configure(rounds, workers, queue_size, timeout)
+    
+    def configure(self, rounds, workers, queue_size, timeout):
+        """(Re)create the worker pool from app settings"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+        self.rounds = rounds
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bcrypt')
+        # Jobs running plus jobs waiting; anything beyond this is rejected
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+    
+    def _run(self, func, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HashingBusy()
+        try:
+            future = self._executor.submit(func, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            raise HashingBusy()
+    
+    def hash(self, password):
+        """Hash a password at the configured work factor"""
+        return self._run(bcrypt.generate_password_hash, password, self.rounds).decode('utf-8')
+    
+    def check(self, password_hash, password):
+        """Verify a password against a stored hash"""
+        return self._run(bcrypt.check_password_hash, password_hash, password)
+    
+    def needs_rehash(self, password_hash):
+        """True if the hash was made with a different work factor"""
+        try:
+            return int(password_hash.split('$')[2]) != self.rounds
+        except (IndexError, ValueError):
+            return True
+
+
+class TokenBucketLimiter:
+    """In-process token buckets keyed by any hashable value"""
+    
+    def __init__(self, capacity, period):
+        self._lock = threading.Lock()
+        self.configure(capacity, period)
+    
+    def configure(self, capacity, period):
+        """Set the burst size and refill period; a capacity of 0 disables limiting"""
+        with self._lock:
+            self.capacity = capacity
+            self.rate = capacity / period if period else 0
+            self._buckets = {}
+    
+    def consume(self, key):
+        """Take one token for key; False when the bucket is empty"""
+        if self.capacity <= 0:
+            return True
+        
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (self.capacity, now))
+            tokens = min(self.capacity, tokens + (now - updated) * self.rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            
+            if len(self._buckets) > 10000:
+                self._prune(now)
+        return allowed
+    
+    def _prune(self, now):
+        # Forget buckets that have refilled completely
+        for key, (tokens, updated) in list(self._buckets.items()):
+            if tokens + (now - updated) * self.rate >= self.capacity:
+                del self._buckets[key]
+
+
+password_hasher = PasswordHasher()
+login_ip_limiter = TokenBucketLimiter(capacity=20, period=60)
+login_account_limiter = TokenBucketLimiter(capacity=5, period=60)
+
+
+def init_security(app):
+    """Configure hashing and login throttling from app config"""
+    password_hasher.configure(
+        rounds=app.config['BCRYPT_LOG_ROUNDS'],
+        workers=app.config['PASSWORD_HASH_WORKERS'],
+        queue_size=app.config['PASSWORD_HASH_QUEUE'],
+        timeout=app.config['PASSWORD_HASH_TIMEOUT']
+    )
+    
+    period = app.config['LOGIN_RATE_PERIOD']
+    login_ip_limiter.configure(app.config['LOGIN_RATE_PER_IP'], period)
+    login_account_limiter.configure(app.config['LOGIN_RATE_PER_ACCOUNT'], period)
+    
+    # Behind a reverse proxy every request comes from the proxy's address;
+    # take the client address from X-Forwarded-For set by trusted hops only
+    proxies = app.config['TRUSTED_PROXIES']
+    if proxies:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=proxies, x_proto=proxies)
+
+
+def login_allowed(ip, account):
+    """Check both the per-IP and the per-account login buckets"""
+    # Consume from both so a single IP cannot spread attempts across accounts
+    # and credential stuffing from many IPs still runs dry on the account.
+    # The account bucket refills within LOGIN_RATE_PERIOD, so the owner is
+    # only slowed down, never locked out for good
+    ip = ip or 'unknown'
+    ip_ok = login_ip_limiter.consume(ip)
+    account_ok = login_account_limiter.consume((account or '').strip().lower())
+    return ip_ok and account_ok
+
+
+def remember_identity(user):
+    """Keep the user's identity in the signed session, stamped with when it was checked"""
+    session['_user_identity'] = user.identity()
+    session['_user_identity_at'] = time.time()
+
+
+def forget_identity():
+    """Drop the identity kept by remember_identity"""
+    session.pop('_user_identity', None)
+    session.pop('_user_identity_at', None)
@@ -0,0 +1,231 @@
+import argparse
+import multiprocessing
+import os
+
+
+def default_workers():
+    """Gunicorn's usual rule of thumb: two workers per core plus one"""
+    return multiprocessing.cpu_count() * 2 + 1
+
+
+def default_threads():
+    """Threads per worker; I/O-bound views (API sync) benefit from a few"""
+    return min(8, max(2, multiprocessing.cpu_count()))
+
+
+def build_options(args):
+    """Translate command line arguments into gunicorn settings"""
+    worker_class = args.worker_class or ('gthread' if args.threads > 1 else 'sync')
+    # gevent patches the stdlib after fork, so objects created while preloading
+    # would keep blocking primitives; load the app inside each worker instead
+    greenlets = worker_class == 'gevent'
+    
+    return {
+        'bind': args.bind,
+        'workers': args.workers,
+        'threads': args.threads,
+        'worker_class': worker_class,
+        'worker_connections': args.worker_connections if greenlets else None,
+        'timeout': args.timeout,
+        'graceful_timeout': args.graceful_timeout,
+        'keepalive': 5,
+        # Load the app once in the master so workers share its memory copy-on-write
+        'preload_app': not greenlets,
+        # Recycle workers periodically to cap slow memory growth
+        'max_requests': args.max_requests,
+        'max_requests_jitter': args.max_requests // 10,
+        'pidfile': args.pidfile,
+        'accesslog': '-' if args.access_log else None,
+        'post_fork': post_fork,
+    }
+
+
+def post_fork(server, worker):
+    """Drop resources inherited from the master that must not be shared"""
+    from models import db
+    from security import init_security
+    app = server.app.application
+    if app is None:
+        # Not preloaded: the worker creates its own app after this hook
+        return
+    with app.app_context():
+        # Pooled DB connections opened before the fork belong to the master
+        db.engine.dispose()
+    init_security(app)
+
+
+def serve(args):
+    """Run the app under a pre-fork gunicorn master"""
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        raise SystemExit('gunicorn is required for "serve" (pip install gunicorn); '
+                         'it is not available on Windows, use "python app.py" there.')
+    
+    # Settings read the worker class to decide whether live updates default on
+    options = build_options(args)
+    os.environ['WEB_WORKER_CLASS'] = options['worker_class']
+    from app import create_app
+    
+    class TaskTrackerServer(BaseApplication):
+        def __init__(self, options):
+            self.options = options
+            self.application = None
+            super().__init__()
+        
+        def load_config(self):
+            for key, value in self.options.items():
+                if value is not None:
+                    self.cfg.set(key, value)
+        
+        def load(self):
+            if self.application is None:
+                self.application = create_app()
+            return self.application
+    
+    concurrency = f'{args.worker_connections} connections' if args.worker_class == 'gevent' else f'{args.threads} threads'
+    print(f"Serving on {args.bind} with {args.workers} workers x {concurrency} "
+          f"(send SIGHUP to the master for a graceful reload)")
+    TaskTrackerServer(options).run()
+
+
+def run_migrations(args):
+    """Show or apply pending schema migrations"""
+    import migrations
+    from app import create_app
+    from config import Config
+    
+    class MigrateConfig(Config):
+        # Leave the schema alone at boot: the version check would refuse an
+        # old schema, and create_all() would change it before --status reports
+        SCHEMA_ON_STARTUP = False
+    
+    app = create_app(MigrateConfig)
+    with app.app_context():
+        if args.status:
+            print(f'Database version: {migrations.current_version()} (app expects {migrations.SCHEMA_VERSION})')
+            for migration in migrations.pending_migrations():
+                print(f'  pending {migration.version}: {migration.description}')
+            return
+        
+        applied = migrations.migrate()
+        print(f'Applied migrations: {applied}' if applied else 'Database is up to date.')
+
+
+def sync_all(args):
+    """Refresh every user's GitHub and LeetCode stats"""
+    from app import create_app
+    from scheduler import sync_all_platforms
+    
+    app = create_app()
+    settings = {
+        'concurrency': args.concurrency or app.config['SYNC_CONCURRENCY'],
+        'github_rate': app.config['SYNC_GITHUB_RATE'],
+        'leetcode_rate': app.config['SYNC_LEETCODE_RATE'],
+        'leetcode_batch_size': args.batch_size or app.config['SYNC_LEETCODE_BATCH_SIZE'],
+        'write_batch_size': app.config['SYNC_WRITE_BATCH_SIZE'],
+    }
+    with app.app_context():
+        sync_all_platforms(settings)
+
+
+def archive(args):
+    """Move old completed tasks into the archive"""
+    from app import create_app
+    from archival import archive_completed_tasks
+    
+    app = create_app()
+    with app.app_context():
+        try:
+            archive_completed_tasks(args.older_than or app.config['ARCHIVE_AFTER_DAYS'], args.batch_size)
+        except ValueError as e:
+            raise SystemExit(str(e))
+
+
+def manage_shards(args):
+    """Inspect shards and move users between them"""
+    from app import create_app
+    from models import db, User
+    from sharding import shards
+    
+    app = create_app()
+    with app.app_context():
+        if args.action == 'init':
+            shards.init_schemas()
+        elif args.action == 'move':
+            if not 0 <= args.shard < shards.count:
+                raise SystemExit(f'Shard must be between 0 and {shards.count - 1}')
+            shards.move_user(args.user_id, args.shard)
+        elif args.action == 'rebalance':
+            moves = shards.plan_rebalance(shards.loads(), tolerance=args.tolerance)
+            for user_id, source, target in moves:
+                if args.dry_run:
+                    print(f'  would move user {user_id} from shard {source} to shard {target}')
+                else:
+                    shards.move_user(user_id, target)
+            print(f'{len(moves)} users to move' if args.dry_run else f'Moved {len(moves)} users')
+        elif args.action == 'purge':
+            print(f'Removed {shards.purge_orphans()} orphaned rows')
+        else:
+            users = dict(db.session.query(User.shard, db.func.count(User.id)).group_by(User.shard).all())
+            for shard, load in shards.loads().items():
+                print(f'shard {shard}: {users.get(shard, 0)} users, {sum(load.values())} tasks')
+
+
+def build_parser():
+    """Command line parser; defaults are read from the environment"""
+    parser = argparse.ArgumentParser(prog='python -m task_tracker')
+    commands = parser.add_subparsers(dest='command', required=True)
+    
+    serve_parser = commands.add_parser('serve', help='run the production server')
+    serve_parser.add_argument('--bind', default=os.environ.get('BIND', f"0.0.0.0:{os.environ.get('PORT', 5000)}"))
+    serve_parser.add_argument('--workers', type=int, default=int(os.environ.get('WEB_WORKERS', default_workers())))
+    serve_parser.add_argument('--threads', type=int, default=int(os.environ.get('WEB_THREADS', default_threads())))
+    serve_parser.add_argument('--worker-class', choices=['sync', 'gthread', 'gevent'],
+                              default=os.environ.get('WEB_WORKER_CLASS'),
+                              help='gevent serves many idle SSE connections per worker')
+    serve_parser.add_argument('--worker-connections', type=int, default=1000)
+    serve_parser.add_argument('--timeout', type=int, default=30)
+    serve_parser.add_argument('--graceful-timeout', type=int, default=30)
+    serve_parser.add_argument('--max-requests', type=int, default=5000)
+    serve_parser.add_argument('--pidfile', default=None)
+    serve_parser.add_argument('--access-log', action='store_true')
+    serve_parser.set_defaults(func=serve)
+    
+    migrate_parser = commands.add_parser('migrate', help='apply pending schema migrations')
+    migrate_parser.add_argument('--status', action='store_true', help='list pending migrations only')
+    migrate_parser.set_defaults(func=run_migrations)
+    
+    sync_parser = commands.add_parser('sync-all', help="refresh every user's platform stats (run nightly from cron)")
+    sync_parser.add_argument('--concurrency', type=int, help='parallel requests per host')
+    sync_parser.add_argument('--batch-size', type=int, help='LeetCode usernames per GraphQL query')
+    sync_parser.set_defaults(func=sync_all)
+    
+    archive_parser = commands.add_parser('archive', help='move old completed tasks to the archive')
+    archive_parser.add_argument('--older-than', type=int, help='age in days (default ARCHIVE_AFTER_DAYS)')
+    archive_parser.add_argument('--batch-size', type=int, default=1000)
+    archive_parser.set_defaults(func=archive)
+    
+    shards_parser = commands.add_parser('shards', help='show shard usage or move users between shards')
+    shards_actions = shards_parser.add_subparsers(dest='action')
+    shards_actions.add_parser('status', help='users and tasks per shard (default)')
+    shards_actions.add_parser('init', help='create tables on newly configured shards')
+    move_parser = shards_actions.add_parser('move', help="move one user's data to another shard")
+    move_parser.add_argument('user_id', type=int)
+    move_parser.add_argument('shard', type=int)
+    rebalance_parser = shards_actions.add_parser('rebalance', help='move users until task counts are even')
+    rebalance_parser.add_argument('--tolerance', type=float, default=0.1,
+                                  help='acceptable gap as a fraction of the largest shard')
+    rebalance_parser.add_argument('--dry-run', action='store_true')
+    shards_actions.add_parser('purge', help='delete rows left behind by interrupted moves')
+    shards_parser.set_defaults(func=manage_shards)
+    return parser
+
+
+def main(argv=None):
+    """Command line entry point: python -m task_tracker serve"""
+    from dotenv import load_dotenv
+    load_dotenv()
+    
+    args = build_parser().parse_args(argv)
+    args.func(args)
@@ -0,0 +1,385 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+import sqlalchemy as sa
+from flask import current_app
+from flask_sqlalchemy.session import Session
+from sqlalchemy.schema import CreateTable, CreateIndex
+from sqlalchemy.sql.util import find_tables
+from cache import TTLCache
+
+# Shard N > 0 hands out ids from N * SHARD_ID_SPAN upwards, so ids stay unique
+# across shards. Moved rows get new ids from the target shard; inserting their
+# old ids would push the target's sequence into another shard's range
+SHARD_ID_SPAN = 10 ** 9
+
+
+class ShardNotSelected(RuntimeError):
+    """Raised when a sharded table is used before a shard has been chosen"""
+
+
+class ShardMoveFailed(RuntimeError):
+    """Raised when a user's rows keep changing during a move, or the move overran its timeout"""
+
+
+def surrogate_key(table):
+    """Name of a table's single integer primary key column, or None"""
+    pk = list(table.primary_key.columns)
+    if len(pk) == 1 and isinstance(pk[0].type, sa.Integer):
+        return pk[0].name
+    return None
+
+
+def is_sharded(mapper=None, clause=None):
+    """True if a statement touches a table marked with info={'sharded': True}"""
+    if mapper is not None:
+        return sa.inspect(mapper).local_table.info.get('sharded', False)
+    if clause is not None:
+        return any(t.info.get('sharded', False) for t in find_tables(clause, include_crud=True))
+    return False
+
+
+class ShardedSession(Session):
+    """Session that sends sharded tables to the shard pinned in session.info['shard']"""
+    
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and shards.count > 1 and is_sharded(mapper, clause):
+            shard = self.info.get('shard')
+            if shard is None:
+                raise ShardNotSelected('Pin a shard with shards.pin() or shards.using() first')
+            return self._db.engines[shards.bind_key(shard)]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+class ShardMap:
+    """Which shards exist and which one holds each user's tasks and stats.
+    
+    Shard 0 is the main database. Extra shards are the 'shard1', 'shard2', ...
+    binds. The users.shard column is the directory; lookups are cached per
+    process for SHARD_DIRECTORY_TTL seconds. Writes route by the user row
+    they load, so only reads can use a stale entry. users.shard_moved_at is
+    set while a move runs; writes are refused until it is cleared or the
+    move is older than SHARD_MOVE_TIMEOUT.
+    """
+    
+    def __init__(self):
+        self.count = 1
+        self.directory = TTLCache(ttl=30, maxsize=65536)
+        self.move_timeout = timedelta(seconds=600)
+    
+    def configure(self, count, directory_ttl, move_timeout=600):
+        self.count = count
+        self.directory.configure(ttl=directory_ttl)
+        self.move_timeout = timedelta(seconds=move_timeout)
+    
+    def moving(self, moved_at):
+        """True while a move marked at moved_at (users.shard_moved_at) may still be running"""
+        return moved_at is not None and datetime.utcnow() - moved_at < self.move_timeout
+    
+    def all(self):
+        return list(range(self.count))
+    
+    def bind_key(self, shard):
+        return None if shard == 0 else f'shard{shard}'
+    
+    def engine(self, shard):
+        from models import db
+        return db.engines[self.bind_key(shard)]
+    
+    def tables(self):
+        """Tables that live on every shard"""
+        from models import db
+        return [t for t in db.metadata.sorted_tables if t.info.get('sharded')]
+    
+    def create_all(self):
+        """db.create_all() over the current app's binds only.
+        
+        Flask-SQLAlchemy keeps a metadata for every bind key it has seen, so
+        another app in the same process would trip over shard binds it does
+        not configure.
+        """
+        from models import db
+        db.create_all(bind_key=list(db.engines))
+    
+    def shard_of(self, user_id, fresh=False):
+        """The shard holding a user's data"""
+        if self.count == 1:
+            return 0
+        shard = None if fresh else self.directory.get(user_id)
+        if shard is None:
+            from models import db, User
+            shard = db.session.query(User.shard).filter_by(id=user_id).scalar() or 0
+            self.directory.set(user_id, shard)
+        return shard
+    
+    def pick_shard(self):
+        """Shard for a new user: the one with the fewest users"""
+        if self.count == 1:
+            return 0
+        from models import db, User
+        users = dict(db.session.query(User.shard, sa.func.count(User.id)).group_by(User.shard).all())
+        return min(self.all(), key=lambda shard: users.get(shard, 0))
+    
+    def pin(self, user_id, shard=None):
+        """Route this session's sharded queries to the user's shard.
+        
+        Pass the shard from a freshly loaded user row to bypass (and
+        refresh) the cached directory.
+        """
+        from models import db
+        if self.count > 1:
+            if shard is None:
+                shard = self.shard_of(user_id)
+            else:
+                self.directory.set(user_id, shard)
+            db.session.info['shard'] = shard
+    
+    @contextmanager
+    def using(self, shard):
+        """Temporarily pin a shard; pending changes are flushed to the shard they belong to"""
+        from models import db
+        previous = db.session.info.get('shard')
+        db.session.flush()
+        db.session.info['shard'] = shard
+        try:
+            yield
+            db.session.flush()
+        finally:
+            db.session.info['shard'] = previous
+    
+    def fan_out(self, func):
+        """Run func(shard) on every shard in parallel; returns {shard: result}.
+        
+        Each call gets its own app context and session, so func should only
+        read, or commit its own writes.
+        """
+        from models import db
+        app = current_app._get_current_object()
+        
+        def run(shard):
+            with app.app_context():
+                try:
+                    with self.using(shard):
+                        return func(shard)
+                finally:
+                    db.session.remove()
+        
+        with ThreadPoolExecutor(max_workers=self.count, thread_name_prefix='shard') as pool:
+            return dict(zip(self.all(), pool.map(run, self.all())))
+    
+    def init_schema(self, shard, report=print):
+        """Create the sharded tables on an extra shard and start its id range"""
+        if shard == 0:
+            return  # the main database gets its tables from migrations
+        engine = self.engine(shard)
+        existing = set(sa.inspect(engine).get_table_names())
+        
+        with engine.begin() as conn:
+            for table in self.tables():
+                if table.name in existing:
+                    continue
+                # Shard tables cannot reference users, which lives in the main database
+                copy = table.to_metadata(sa.MetaData())
+                copy.dialect_options['sqlite']['autoincrement'] = True
+                conn.execute(CreateTable(copy, include_foreign_key_constraints=[]))
+                for index in copy.indexes:
+                    conn.execute(CreateIndex(index))
+                
+                key = surrogate_key(copy)
+                if key:
+                    start = shard * SHARD_ID_SPAN
+                    if engine.dialect.name == 'sqlite':
+                        conn.execute(sa.text('INSERT INTO sqlite_sequence (name, seq) VALUES (:name, :start)'),
+                                     {'name': table.name, 'start': start})
+                    elif engine.dialect.name == 'postgresql':
+                        conn.execute(sa.text(f"SELECT setval(pg_get_serial_sequence('{table.name}', '{key}'), :start)"),
+                                     {'start': start})
+                report(f'  shard {shard}: created table {table.name}')
+    
+    def init_schemas(self, report=print):
+        for shard in self.all():
+            self.init_schema(shard, report)
+    
+    def move_user(self, user_id, target, report=print, attempts=3):
+        """Copy a user's rows to another shard, switch the directory, then clean up.
+        
+        The user's writes are refused from the moment the move is marked
+        until the switch. A request that loaded the user just before can
+        still write to the source, so the copy is compared with the source
+        again and redone if it changed. Safe to re-run: the copy replaces
+        whatever an earlier interrupted run left on the target, and the
+        source is only cleared after the switch. Copied rows get new ids on
+        the target. Reads in other processes may use the old shard for up to
+        SHARD_DIRECTORY_TTL seconds, so run it while the user is inactive.
+        """
+        from models import db, User
+        
+        source = self.shard_of(user_id, fresh=True)
+        db.session.rollback()
+        if source == target:
+            return 0
+        self.init_schema(target, report)
+        
+        # Mark the move before copying: writes stop and purge_orphans leaves the copy alone
+        users = User.__table__
+        marked_at = datetime.utcnow()
+        db.session.execute(users.update().where(users.c.id == user_id).values(shard_moved_at=marked_at))
+        db.session.commit()
+        
+        for _ in range(attempts):
+            copied = self._copy_rows(user_id, source, target)
+            if self._read_rows(user_id, source) == copied:
+                break
+        else:
+            raise ShardMoveFailed(f'rows of user {user_id} kept changing on shard {source}; re-run the move')
+        
+        # Switch the directory unless the move overran its timeout (writes
+        # may have resumed) or another run took it over; the data version
+        # bump refreshes cached pages
+        switched = db.session.execute(
+            users.update()
+            .where(users.c.id == user_id, users.c.shard_moved_at == marked_at)
+            .values(shard=target, shard_moved_at=None, data_version=users.c.data_version + 1)
+        ).rowcount
+        if not switched or not self.moving(marked_at):
+            db.session.rollback()
+            raise ShardMoveFailed(f'move of user {user_id} took longer than SHARD_MOVE_TIMEOUT or was restarted')
+        db.session.commit()
+        self.directory.invalidate(user_id)
+        
+        with self.engine(source).begin() as src:
+            for table in reversed(self.tables()):
+                src.execute(table.delete().where(table.c.user_id == user_id))
+        
+        moved = sum(len(rows) for rows in copied.values())
+        report(f'  user {user_id}: moved {moved} rows from shard {source} to shard {target}')
+        return moved
+    
+    def _read_rows(self, user_id, shard):
+        """The user's rows on a shard as {table name: set of rows}, including ids"""
+        with self.engine(shard).connect() as conn:
+            return {
+                table.name: {tuple(row) for row in conn.execute(sa.select(table).where(table.c.user_id == user_id))}
+                for table in self.tables()
+            }
+    
+    def _copy_rows(self, user_id, source, target):
+        """Replace the user's rows on target with those on source; returns what was read"""
+        copied = {}
+        with self.engine(source).connect() as src, self.engine(target).begin() as dst:
+            for table in self.tables():
+                key = surrogate_key(table)
+                rows = src.execute(sa.select(table).where(table.c.user_id == user_id)).all()
+                copied[table.name] = {tuple(row) for row in rows}
+                dst.execute(table.delete().where(table.c.user_id == user_id))
+                if rows:
+                    dst.execute(table.insert(), [
+                        {column: value for column, value in row._mapping.items() if column != key}
+                        for row in rows
+                    ])
+        return copied
+    
+    def loads(self):
+        """Task count per user on each shard: {shard: {user_id: tasks}}"""
+        from models import db, Task
+        
+        def count(shard):
+            rows = db.session.query(Task.user_id, sa.func.count(Task.id)).group_by(Task.user_id).all()
+            return dict(rows)
+        
+        return self.fan_out(count)
+    
+    def plan_rebalance(self, loads, tolerance=0.1):
+        """Greedy list of (user_id, source, target) moves that evens out task counts"""
+        totals = {shard: sum(users.values()) for shard, users in loads.items()}
+        users = {shard: dict(counts) for shard, counts in loads.items()}
+        moves = []
+        
+        while True:
+            heaviest = max(totals, key=totals.get)
+            lightest = min(totals, key=totals.get)
+            gap = totals[heaviest] - totals[lightest]
+            if gap <= tolerance * max(totals[heaviest], 1):
+                break
+            # The user closest to half the gap; anything smaller than the gap
+            # narrows it, so the loop always ends
+            candidates = [(n, uid) for uid, n in users[heaviest].items() if 0 < n < gap]
+            if not candidates:
+                break
+            n, user_id = min(candidates, key=lambda candidate: abs(gap / 2 - candidate[0]))
+            moves.append((user_id, heaviest, lightest))
+            del users[heaviest][user_id]
+            users[lightest][user_id] = n
+            totals[heaviest] -= n
+            totals[lightest] += n
+        return moves
+    
+    def purge_orphans(self, report=print):
+        """Delete rows left on a shard that the directory no longer points to.
+        
+        Owners are looked up in the users table itself, never the cached
+        directory, and users with a move in progress are left alone: their
+        copy on the target does not belong to their shard yet.
+        """
+        from models import db
+        
+        def purge(shard):
+            owners = set()
+            for table in self.tables():
+                owners.update(db.session.execute(sa.select(table.c.user_id).distinct()).scalars())
+            stale = self._orphan_owners(shard, owners)
+            
+            # Delete first, then confirm against a fresh directory read. The
+            # deletes hold their locks until commit, so a move into this shard
+            # either marked the user before the check or copies after it
+            while stale:
+                removed = 0
+                for table in reversed(self.tables()):
+                    removed += db.session.execute(table.delete().where(table.c.user_id.in_(stale))).rowcount
+                confirmed = self._orphan_owners(shard, stale)
+                if confirmed == stale:
+                    db.session.commit()
+                    return removed
+                db.session.rollback()
+                stale = confirmed
+            return 0
+        
+        removed = self.fan_out(purge)
+        for shard, count in removed.items():
+            if count:
+                report(f'  shard {shard}: removed {count} orphaned rows')
+        return sum(removed.values())
+    
+    def _orphan_owners(self, shard, user_ids):
+        """The users in user_ids whose data should not be on this shard, read straight from the database"""
+        from models import db, User
+        if not user_ids:
+            return set()
+        
+        users = User.__table__
+        with db.engine.connect() as conn:
+            rows = conn.execute(
+                sa.select(users.c.id, users.c.shard, users.c.shard_moved_at).where(users.c.id.in_(user_ids))
+            ).all()
+        directory = {user_id: (home, moved_at) for user_id, home, moved_at in rows}
+        
+        orphans = set()
+        for user_id in user_ids:
+            # Rows of deleted users count as belonging to the main database
+            home, moved_at = directory.get(user_id, (0, None))
+            if home != shard and not self.moving(moved_at):
+                orphans.add(user_id)
+        return orphans
+
+
+shards = ShardMap()
+
+
+def init_sharding(app):
+    """Register one bind per extra shard URL; call before db.init_app"""
+    urls = app.config['SHARD_DATABASE_URLS']
+    binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+    for number, url in enumerate(urls, start=1):
+        binds.setdefault(f'shard{number}', url)
+    app.config['SQLALCHEMY_BINDS'] = binds
+    shards.configure(len(urls) + 1, app.config['SHARD_DIRECTORY_TTL'], app.config['SHARD_MOVE_TIMEOUT'])
@@ -0,0 +1,58 @@
+import os
+import sys
+import pytest
+
+# The app uses flat imports from the task_tracker directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+
+
+@pytest.fixture
+def make_app(tmp_path):
+    """Build an app on throwaway SQLite files; keyword arguments override config"""
+    from app import create_app
+    
+    def make(**overrides):
+        settings = {
+            'TESTING': True,
+            'WTF_CSRF_ENABLED': False,
+            'BCRYPT_LOG_ROUNDS': 4,
+            'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path}/main.db',
+            'SQLALCHEMY_BINDS': {},
+            'ARCHIVE_DATABASE_URL': None,
+            'SHARD_DATABASE_URLS': [],
+        }
+        settings.update(overrides)
+        return create_app(type('TestConfig', (Config,), settings))
+    
+    return make
+
+
+@pytest.fixture
+def app(make_app):
+    return make_app()
+
+
+@pytest.fixture
+def mock_http(monkeypatch):
+    """Send outbound httpx calls to handler(request) instead of the network"""
+    import httpx
+    from outbound import outbound
+    
+    def install(handler):
+        def client(**kwargs):
+            kwargs.pop('limits', None)
+            return httpx.AsyncClient(transport=httpx.MockTransport(handler), timeout=outbound.timeout, **kwargs)
+        monkeypatch.setattr(outbound, 'client', client)
+        sync_client = httpx.Client(transport=httpx.MockTransport(handler), timeout=outbound.timeout)
+        monkeypatch.setattr(outbound, 'sync_client', lambda: sync_client)
+    
+    return install
+
+
+def register_and_login(client, name, password='secret12'):
+    """Create an account through the auth views and log the client in"""
+    client.post('/auth/register', data={'username': name, 'email': f'{name}@example.com',
+                                        'password': password, 'confirm_password': password})
+    return client.post('/auth/login', data={'email': f'{name}@example.com', 'password': password})
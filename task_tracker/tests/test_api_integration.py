@@ -0,0 +1,63 @@
+import httpx
+
+from conftest import register_and_login
+from models import PlatformStats
+from outbound import outbound
+
+
+def github(request):
+    if request.url.path.endswith('/repos'):
+        return httpx.Response(200, json=[{'name': 'tool', 'stargazers_count': 3}])
+    if request.url.path.endswith('/public'):
+        return httpx.Response(503)
+    if request.url.path.endswith('/missing'):
+        return httpx.Response(404)
+    return httpx.Response(200, json={'name': 'Octo', 'public_repos': 7})
+
+
+def leetcode(request):
+    return httpx.Response(200, json={'data': {'matchedUser': {
+        'username': 'octo', 'profile': {'ranking': 5, 'reputation': 1},
+        'submitStats': {'acSubmissionNum': [{'difficulty': 'All', 'count': 42}]}}}})
+
+
+def test_github_sync_saves_stats(make_app, mock_http):
+    app = make_app(OUTBOUND_RETRIES=0)
+    mock_http(github)
+    client = app.test_client()
+    register_and_login(client, 'ann')
+    
+    response = client.post('/api/sync/github?username=octo')
+    
+    assert response.status_code == 200
+    data = response.json['data']
+    assert (data['public_repos'], data['total_stars'], data['recent_commits']) == (7, 3, 0)
+    # The failed optional events call keeps the profile out of the cache
+    assert outbound.cache.get(('github', 'octo')) is None
+    with app.app_context():
+        assert PlatformStats.query.filter_by(platform='github').one().get_data()['name'] == 'Octo'
+
+
+def test_github_sync_reports_upstream_errors(make_app, mock_http):
+    app = make_app(OUTBOUND_RETRIES=0)
+    mock_http(github)
+    client = app.test_client()
+    register_and_login(client, 'ann')
+    
+    response = client.post('/api/sync/github?username=missing')
+    
+    assert response.status_code == 500
+    assert response.json['error'] == 'GitHub API error: 404'
+
+
+def test_leetcode_sync_saves_stats(make_app, mock_http):
+    app = make_app()
+    mock_http(leetcode)
+    client = app.test_client()
+    register_and_login(client, 'ann')
+    
+    response = client.post('/api/sync/leetcode', data={'username': 'octo'})
+    
+    assert response.status_code == 200
+    assert response.json['data']['problems_solved']['total'] == 42
+    assert outbound.cache.get(('leetcode', 'octo'))['ranking'] == 5
@@ -0,0 +1,27 @@
+from datetime import datetime, timedelta
+import pytest
+from archival import archive_completed_tasks, MIN_ARCHIVE_AGE_DAYS
+from leaderboards import STREAK_LOOKBACK_DAYS
+from models import db, User, Task, ArchivedTask
+
+
+def test_minimum_age_covers_the_streak_lookback(app):
+    assert MIN_ARCHIVE_AGE_DAYS >= STREAK_LOOKBACK_DAYS
+    with app.app_context(), pytest.raises(ValueError):
+        archive_completed_tasks(STREAK_LOOKBACK_DAYS - 1, report=lambda message: None)
+
+
+def test_only_tasks_past_the_cutoff_are_archived(app):
+    with app.app_context():
+        user = User(username='ann', email='ann@example.com', password_hash='x')
+        db.session.add(user)
+        db.session.flush()
+        now = datetime.utcnow()
+        for days in (STREAK_LOOKBACK_DAYS - 1, STREAK_LOOKBACK_DAYS + 30):
+            db.session.add(Task(user_id=user.id, title=f'{days} days', platform='General',
+                                status='completed', completed_at=now - timedelta(days=days)))
+        db.session.commit()
+        
+        assert archive_completed_tasks(STREAK_LOOKBACK_DAYS, report=lambda message: None) == 1
+        assert [task.title for task in Task.query] == [f'{STREAK_LOOKBACK_DAYS - 1} days']
+        assert ArchivedTask.query.count() == 1
@@ -0,0 +1,60 @@
+import pytest
+
+from models import db, User
+from routes import auth
+
+
+@pytest.fixture
+def client(make_app):
+    auth._username_filter.update(bloom=None, built_at=0)
+    app = make_app(SQL_QUERY_STATS=True)
+    with app.app_context():
+        db.session.add(User(username='ann', email='ann@example.com', password_hash='x'))
+        db.session.commit()
+    yield app.test_client()
+    auth._username_filter.update(bloom=None, built_at=0)
+
+
+def check(client, username):
+    response = client.get('/auth/check-username', query_string={'username': username})
+    return response.json['available'], int(response.headers['X-DB-Queries'])
+
+
+def test_hit_is_confirmed_against_the_database(client):
+    check(client, 'warmup')
+    
+    assert check(client, 'ann') == (False, 1)
+
+
+def test_false_positive_is_reported_available(client):
+    check(client, 'warmup')
+    auth._username_filter['bloom'].add('ghost')
+    
+    assert check(client, 'ghost') == (True, 1)
+
+
+def test_miss_skips_the_database(client):
+    check(client, 'warmup')
+    
+    assert check(client, 'bob') == (True, 0)
+
+
+def test_name_registered_after_the_rebuild(client):
+    check(client, 'warmup')
+    client.post('/auth/register', data={'username': 'bob', 'email': 'bob@example.com',
+                                        'password': 'secret12', 'confirm_password': 'secret12'})
+    
+    assert check(client, 'bob') == (False, 1)
+
+
+def test_name_registered_by_another_worker_is_rejected_on_register(client):
+    check(client, 'warmup')
+    with client.application.app_context():
+        db.session.add(User(username='cat', email='cat@example.com', password_hash='x'))
+        db.session.commit()
+    
+    # Looks free until the next rebuild; the unique constraint catches it
+    assert check(client, 'cat') == (True, 0)
+    response = client.post('/auth/register', data={'username': 'cat', 'email': 'cat2@example.com',
+                                                   'password': 'secret12', 'confirm_password': 'secret12'})
+    assert auth.RegistrationForm.USERNAME_TAKEN in response.get_data(as_text=True)
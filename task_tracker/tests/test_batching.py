@@ -0,0 +1,129 @@
+import threading
+import time
+from datetime import datetime
+from concurrent.futures import TimeoutError as FutureTimeout
+
+import pytest
+from batching import ToggleBatcher
+from models import db, User, Task
+from routes.tasks import apply_toggle, toggle_batcher
+
+
+def add_tasks(count):
+    user = User(username='ann', email='ann@example.com', password_hash='x')
+    db.session.add(user)
+    db.session.flush()
+    tasks = [Task(user_id=user.id, title=f'task {i}', platform='General') for i in range(count)]
+    db.session.add_all(tasks)
+    db.session.commit()
+    return user.id, [task.id for task in tasks]
+
+
+def test_toggle_that_times_out_is_withdrawn(app):
+    with app.app_context():
+        user_id, (first, second) = add_tasks(2)
+    
+    batcher = ToggleBatcher(apply_toggle)
+    batcher.init_app(app)
+    release = threading.Event()
+    apply = batcher._apply
+    
+    def slow_apply(batch):
+        release.wait(5)
+        apply(batch)
+    batcher._apply = slow_apply
+    
+    # The first toggle keeps the writer busy, so the second is never picked up
+    busy = threading.Thread(target=batcher.submit, args=(first, user_id))
+    busy.start()
+    time.sleep(0.1)
+    assert batcher.submit(second, user_id, timeout=0.05) is None
+    release.set()
+    busy.join()
+    time.sleep(0.1)
+    
+    with app.app_context():
+        statuses = dict(db.session.query(Task.id, Task.status))
+    assert statuses == {first: 'completed', second: 'pending'}
+
+
+def test_toggle_route_falls_back_when_batcher_is_backed_up(make_app, monkeypatch):
+    app = make_app(TOGGLE_BATCHING=True)
+    client = app.test_client()
+    client.post('/auth/register', data={'username': 'bob', 'email': 'bob@example.com',
+                                        'password': 'secret12', 'confirm_password': 'secret12'})
+    client.post('/auth/login', data={'email': 'bob@example.com', 'password': 'secret12'})
+    with app.app_context():
+        user_id = db.session.query(User.id).scalar()
+        task = Task(user_id=user_id, title='task', platform='General')
+        db.session.add(task)
+        db.session.commit()
+        task_id = task.id
+    monkeypatch.setattr(toggle_batcher, 'submit', lambda task_id, user_id, status: None)
+    
+    response = client.post(f'/tasks/toggle/{task_id}')
+    
+    assert response.status_code == 200
+    assert response.json['status'] == 'completed'
+
+
+def test_retry_after_a_late_commit_does_not_toggle_back(app):
+    with app.app_context():
+        user_id, (task_id,) = add_tasks(1)
+    
+    batcher = ToggleBatcher(apply_toggle)
+    batcher.init_app(app)
+    release = threading.Event()
+    apply = batcher._apply
+    
+    def slow_apply(batch):
+        release.wait(5)
+        apply(batch)
+    batcher._apply = slow_apply
+    
+    # The batch is already running when the request gives up, then commits
+    with pytest.raises(FutureTimeout):
+        batcher.submit(task_id, user_id, 'completed', timeout=0.05)
+    release.set()
+    time.sleep(0.2)
+    
+    # The client's retry asks for the same status and leaves the task alone
+    outcome, result = batcher.submit(task_id, user_id, 'completed')
+    assert (outcome, result['status']) == ('ok', 'completed')
+    with app.app_context():
+        assert db.session.get(Task, task_id).status == 'completed'
+
+
+def test_toggle_route_sets_the_requested_status(make_app):
+    app = make_app(TOGGLE_BATCHING=True)
+    client = app.test_client()
+    client.post('/auth/register', data={'username': 'bob', 'email': 'bob@example.com',
+                                        'password': 'secret12', 'confirm_password': 'secret12'})
+    client.post('/auth/login', data={'email': 'bob@example.com', 'password': 'secret12'})
+    with app.app_context():
+        user_id = db.session.query(User.id).scalar()
+        task = Task(user_id=user_id, title='task', platform='General')
+        db.session.add(task)
+        db.session.commit()
+        task_id = task.id
+    
+    statuses = [client.post(f'/tasks/toggle/{task_id}', json={'status': 'completed'}).json['status']
+                for _ in range(2)]
+    
+    assert statuses == ['completed', 'completed']
+    assert client.post(f'/tasks/toggle/{task_id}').json['status'] == 'pending'
+    assert client.post(f'/tasks/toggle/{task_id}', json={'status': 'done'}).status_code == 400
+
+
+def test_toggle_is_refused_while_its_user_is_moving(app):
+    with app.app_context():
+        user_id, (task_id,) = add_tasks(1)
+        db.session.get(User, user_id).shard_moved_at = datetime.utcnow()
+        db.session.commit()
+    
+    batcher = ToggleBatcher(apply_toggle)
+    batcher.init_app(app)
+    
+    assert batcher.submit(task_id, user_id) == ('moving', None)
+    with app.app_context():
+        assert db.session.get(Task, task_id).status == 'pending'
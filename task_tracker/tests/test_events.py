@@ -0,0 +1,95 @@
+import json
+import time
+
+import pytest
+
+import events
+from events import broker
+from models import db, DashboardEvent
+
+
+@pytest.fixture
+def sse_app(make_app, monkeypatch):
+    app = make_app(SSE_ENABLED=True, SSE_CROSS_PROCESS=True, SSE_POLL_OVERLAP=30)
+    # Tests drive poll_once() themselves instead of the background thread
+    monkeypatch.setattr(broker, '_poller', 'disabled')
+    with app.app_context():
+        broker.reset_poll_position()
+        yield app
+    broker._subscribers.clear()
+
+
+def drain(q):
+    items = []
+    while not q.empty():
+        items.append(q.get_nowait())
+    return items
+
+
+def write_event(user_id, value, event_id=None, origin='other-worker'):
+    payload = json.dumps({'event': 'stats', 'data': {'value': value}})
+    db.session.add(DashboardEvent(id=event_id, user_id=user_id, origin=origin, payload=payload))
+    db.session.commit()
+
+
+def test_publish_delivers_on_commit_only(sse_app):
+    q = broker.subscribe(1)
+    broker.publish(1, 'stats', {'value': 1})
+    assert drain(q) == []
+    
+    db.session.commit()
+    assert drain(q) == [{'event': 'stats', 'data': {'value': 1}}]
+    
+    broker.publish(1, 'stats', {'value': 2})
+    db.session.rollback()
+    assert drain(q) == []
+    assert DashboardEvent.query.count() == 1
+
+
+def test_poll_forwards_other_processes_events_once(sse_app):
+    q = broker.subscribe(1)
+    write_event(1, 'a')
+    write_event(2, 'b')
+    write_event(1, 'own', origin=events.ORIGIN)
+    
+    broker.poll_once()
+    broker.poll_once()
+    
+    assert [item['data']['value'] for item in drain(q)] == ['a']
+
+
+def test_poll_without_subscribers_does_not_replay_later(sse_app):
+    write_event(1, 'old')
+    broker.poll_once()
+    
+    q = broker.subscribe(1)
+    write_event(1, 'new')
+    broker.poll_once()
+    
+    assert [item['data']['value'] for item in drain(q)] == ['new']
+
+
+def test_late_commit_below_the_high_water_mark_is_delivered(sse_app):
+    q = broker.subscribe(1)
+    write_event(1, 'first', event_id=1)
+    write_event(1, 'third', event_id=3)
+    broker.poll_once()
+    
+    # Id 2 was assigned earlier but its transaction commits only now
+    write_event(1, 'second', event_id=2)
+    broker.poll_once()
+    broker.poll_once()
+    
+    assert [item['data']['value'] for item in drain(q)] == ['first', 'third', 'second']
+
+
+def test_gaps_expire_after_the_overlap(sse_app, monkeypatch):
+    write_event(1, 'first', event_id=1)
+    write_event(1, 'third', event_id=3)
+    broker.poll_once()
+    assert set(broker._gaps) == {2}
+    
+    later = time.monotonic() + 31
+    monkeypatch.setattr(events.time, 'monotonic', lambda: later)
+    broker.poll_once()
+    assert broker._gaps == {}
@@ -0,0 +1,77 @@
+import gzip
+
+from conftest import register_and_login
+from models import db, User, Task
+
+
+def logged_in(app):
+    client = app.test_client()
+    register_and_login(client, 'ann')
+    return client
+
+
+def test_unchanged_data_answers_304(app):
+    client = logged_in(app)
+    
+    first = client.get('/dashboard/api/chart-data')
+    assert first.status_code == 200
+    etag = first.headers['ETag']
+    assert etag.startswith('W/')
+    
+    again = client.get('/dashboard/api/chart-data', headers={'If-None-Match': etag})
+    assert again.status_code == 304
+    assert again.data == b''
+    assert again.headers['ETag'] == etag
+
+
+def test_new_data_changes_the_etag(app):
+    client = logged_in(app)
+    etag = client.get('/dashboard/api/chart-data').headers['ETag']
+    
+    with app.app_context():
+        user = User.query.filter_by(username='ann').one()
+        db.session.add(Task(user_id=user.id, title='new', platform='General'))
+        db.session.commit()
+    
+    response = client.get('/dashboard/api/chart-data', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+
+def test_large_pages_are_gzipped(app):
+    client = logged_in(app)
+    
+    plain = client.get('/dashboard/')
+    zipped = client.get('/dashboard/', headers={'Accept-Encoding': 'gzip'})
+    
+    assert 'Content-Encoding' not in plain.headers
+    assert 'Accept-Encoding' in plain.headers['Vary']
+    assert zipped.headers['Content-Encoding'] == 'gzip'
+    assert len(zipped.data) < len(plain.data)
+    assert gzip.decompress(zipped.data).rstrip().endswith(b'</html>')
+
+
+def test_small_responses_are_sent_as_is(make_app):
+    app = make_app(COMPRESS_MIN_SIZE=10 ** 6)
+    client = logged_in(app)
+    
+    response = client.get('/dashboard/api/chart-data', headers={'Accept-Encoding': 'gzip'})
+    
+    assert response.status_code == 200
+    assert 'Content-Encoding' not in response.headers
+
+
+def test_fingerprinted_static_files_are_immutable(app):
+    client = app.test_client()
+    with app.test_request_context():
+        from flask import url_for
+        url = url_for('static', filename='css/style.css')
+    assert '?v=' in url
+    
+    response = client.get(url, headers={'Accept-Encoding': 'gzip'})
+    
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.cache_control.immutable and response.cache_control.max_age == 31536000
+    with open(f'{app.static_folder}/css/style.css', 'rb') as f:
+        assert gzip.decompress(response.data) == f.read()
+    response.close()
@@ -0,0 +1,22 @@
+from conftest import register_and_login
+
+
+def test_debug_stats_needs_a_listed_user(make_app):
+    app = make_app(SQL_QUERY_STATS=True, DEBUG_STATS_USERS=['ops'])
+    anonymous, member, operator = app.test_client(), app.test_client(), app.test_client()
+    register_and_login(member, 'ann')
+    register_and_login(operator, 'ops')
+    
+    assert anonymous.get('/debug/stats').status_code == 302
+    assert member.get('/debug/stats').status_code == 404
+    response = operator.get('/debug/stats')
+    assert response.status_code == 200
+    assert 'queries' in response.json
+
+
+def test_debug_stats_is_absent_without_query_stats(make_app):
+    app = make_app(SQL_QUERY_STATS=False, DEBUG_STATS_USERS=['ops'])
+    client = app.test_client()
+    register_and_login(client, 'ops')
+    
+    assert client.get('/debug/stats').status_code == 404
@@ -0,0 +1,60 @@
+import leaderboards
+from leaderboards import RankIndex, upsert_score
+from models import db, User
+
+
+def test_rank_index_ties_share_a_rank():
+    index = RankIndex(size=4)
+    for user_id, score in {1: 5, 2: 9, 3: 5, 4: 2}.items():
+        index.set(user_id, score)
+    
+    assert [index.rank(score) for score in (9, 5, 2)] == [1, 2, 4]
+
+
+def test_rank_index_leaves_out_zero_scores():
+    index = RankIndex()
+    index.set(1, 3)
+    index.set(2, 0)
+    index.set(1, 0)
+    
+    assert index.scores == {}
+    assert index.rank(1) == 1
+
+
+def test_top_and_my_rank_agree_on_ties(app):
+    with app.app_context():
+        for name, score in [('ann', 7), ('bob', 7), ('cat', 3), ('dan', 0)]:
+            user = User(username=name, email=f'{name}@example.com', password_hash='x')
+            db.session.add(user)
+            db.session.flush()
+            upsert_score(db.session, 'leetcode', user.id, score)
+        db.session.commit()
+        leaderboards._indexes.clear()
+        users = dict(db.session.query(User.username, User.id))
+        
+        top = leaderboards.top('leetcode', limit=10)
+        assert [(entry['username'], entry['rank']) for entry in top] in (
+            [('ann', 1), ('bob', 1), ('cat', 3)], [('bob', 1), ('ann', 1), ('cat', 3)]
+        )
+        assert leaderboards.my_rank('leetcode', users['bob'], max_age=0) == {'score': 7, 'rank': 1, 'total': 3}
+        assert leaderboards.my_rank('leetcode', users['dan'], max_age=0) == {'score': 0, 'rank': None, 'total': 3}
+
+
+def test_top_ranks_ignore_a_stale_rank_index(app):
+    with app.app_context():
+        for name, score in [('ann', 5), ('bob', 2)]:
+            user = User(username=name, email=f'{name}@example.com', password_hash='x')
+            db.session.add(user)
+            db.session.flush()
+            upsert_score(db.session, 'leetcode', user.id, score)
+        db.session.commit()
+        leaderboards._indexes.clear()
+        leaderboards.get_rank_index('leetcode', max_age=60)
+        
+        # Another worker raises bob above ann; this process's index still has the old scores
+        bob = User.query.filter_by(username='bob').one()
+        upsert_score(db.session, 'leetcode', bob.id, 9)
+        db.session.commit()
+        
+        top = leaderboards.top('leetcode')
+        assert [(entry['username'], entry['score'], entry['rank']) for entry in top] == [('bob', 9, 1), ('ann', 5, 2)]
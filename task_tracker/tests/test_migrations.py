@@ -0,0 +1,32 @@
+import sqlalchemy as sa
+import pytest
+import server
+from config import Config
+from models import SCHEMA_VERSION
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    """Point the CLI's Config at an empty SQLite file"""
+    url = f'sqlite:///{tmp_path}/main.db'
+    monkeypatch.setattr(Config, 'SQLALCHEMY_DATABASE_URI', url)
+    monkeypatch.setattr(Config, 'SHARD_DATABASE_URLS', [])
+    monkeypatch.setattr(Config, 'ARCHIVE_DATABASE_URL', None)
+    return sa.create_engine(url)
+
+
+def test_status_does_not_touch_the_schema(database, capsys):
+    server.main(['migrate', '--status'])
+    
+    assert sa.inspect(database).get_table_names() == []
+    assert f'pending {SCHEMA_VERSION}:' in capsys.readouterr().out
+
+
+def test_migrate_brings_database_to_latest_version(database, capsys):
+    server.main(['migrate'])
+    capsys.readouterr()
+    server.main(['migrate', '--status'])
+    
+    out = capsys.readouterr().out
+    assert f'Database version: {SCHEMA_VERSION}' in out
+    assert 'pending' not in out
@@ -0,0 +1,126 @@
+import asyncio
+import time
+import httpx
+import pytest
+from outbound import OutboundClient, CircuitOpen
+
+
+def make_client(**settings):
+    outbound = OutboundClient()
+    outbound.configure(**dict({'retries': 2, 'backoff': 0, 'failure_threshold': 2, 'reset_timeout': 0}, **settings))
+    return outbound
+
+
+def send(outbound, handler, url='https://api.example.com/x'):
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            return await outbound.request(client, 'example', 'GET', url)
+    return asyncio.run(run())
+
+
+def refuse(request):
+    raise httpx.ConnectError('connection refused', request=request)
+
+
+def test_retries_transient_statuses_then_succeeds():
+    outbound = make_client()
+    statuses = iter([503, 502, 200])
+    
+    response = send(outbound, lambda request: httpx.Response(next(statuses)))
+    
+    assert response.status_code == 200
+    assert outbound.breaker('example')._failures == 0
+
+
+def test_transport_errors_raise_after_retries_and_open_the_breaker():
+    outbound = make_client(failure_threshold=3, reset_timeout=60)
+    calls = []
+    
+    def handler(request):
+        calls.append(request)
+        refuse(request)
+    
+    with pytest.raises(httpx.ConnectError):
+        send(outbound, handler)
+    with pytest.raises(CircuitOpen):
+        send(outbound, handler)
+    assert len(calls) == 3
+
+
+def test_half_open_probe_closes_the_breaker_on_success():
+    outbound = make_client(retries=0, failure_threshold=1)
+    with pytest.raises(httpx.ConnectError):
+        send(outbound, refuse)
+    
+    assert send(outbound, lambda request: httpx.Response(200)).status_code == 200
+    assert outbound.breaker('example')._opened_at is None
+
+
+def test_unexpected_error_does_not_leave_the_probe_stuck():
+    outbound = make_client(retries=0, failure_threshold=1)
+    with pytest.raises(httpx.ConnectError):
+        send(outbound, refuse)
+    
+    def broken(request):
+        raise ValueError('not an httpx error')
+    
+    # The probe fails in a way that says nothing about the service...
+    with pytest.raises(ValueError):
+        send(outbound, broken)
+    # ...and the next call may probe again instead of being refused forever
+    assert send(outbound, lambda request: httpx.Response(200)).status_code == 200
+
+
+def test_cancelled_probe_releases_the_breaker():
+    outbound = make_client(retries=0, failure_threshold=1)
+    with pytest.raises(httpx.ConnectError):
+        send(outbound, refuse)
+    
+    async def hang(request):
+        await asyncio.sleep(10)
+    
+    async def cancel_probe():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(hang)) as client:
+            probe = asyncio.ensure_future(outbound.request(client, 'example', 'GET', 'https://api.example.com/x'))
+            await asyncio.sleep(0.01)
+            probe.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await probe
+    
+    asyncio.run(cancel_probe())
+    assert send(outbound, lambda request: httpx.Response(200)).status_code == 200
+
+
+def test_timeouts_are_not_retried():
+    outbound = make_client(failure_threshold=5)
+    calls = []
+    
+    def hang(request):
+        calls.append(request)
+        time.sleep(0.2)
+        raise httpx.ReadTimeout('timed out', request=request)
+    
+    started = time.monotonic()
+    with pytest.raises(httpx.ReadTimeout):
+        send(outbound, hang)
+    
+    # One timeout's worth of waiting, not one per attempt
+    assert time.monotonic() - started < 0.4
+    assert len(calls) == 1
+    assert outbound.breaker('example')._failures == 1
+
+
+def test_sync_requests_share_the_retry_policy(monkeypatch):
+    outbound = make_client()
+    statuses = iter([503, 200])
+    client = httpx.Client(transport=httpx.MockTransport(lambda request: httpx.Response(next(statuses))))
+    monkeypatch.setattr(outbound, 'sync_client', lambda: client)
+    
+    assert outbound.request_sync('example', 'GET', 'https://api.example.com/x').status_code == 200
+    
+    def hang(request):
+        raise httpx.ConnectTimeout('timed out', request=request)
+    client = httpx.Client(transport=httpx.MockTransport(hang))
+    with pytest.raises(httpx.ConnectTimeout):
+        outbound.request_sync('example', 'GET', 'https://api.example.com/x')
+    assert outbound.breaker('example')._failures == 1
@@ -0,0 +1,79 @@
+import pytest
+
+from cache import platform_count_cache
+from models import db, User, Task
+
+
+@pytest.fixture
+def user(app):
+    with app.app_context():
+        user = User(username='ann', email='ann@example.com', password_hash='x')
+        db.session.add(user)
+        db.session.flush()
+        db.session.add_all([Task(user_id=user.id, title=f'lc {i}', platform='LeetCode') for i in range(2)])
+        db.session.add(Task(user_id=user.id, title='gh', platform='GitHub'))
+        db.session.commit()
+        yield user
+    platform_count_cache.clear()
+
+
+def cached_counts(user):
+    version = db.session.query(User.data_version).filter_by(id=user.id).scalar()
+    entry = platform_count_cache.get(user.id)
+    assert entry is not None and entry[0] == version
+    return {platform: counts['tasks'] for platform, counts in entry[1].items()}
+
+
+def test_writes_update_the_cached_counts_in_place(user):
+    assert user.get_platform_counts()['LeetCode']['tasks'] == 2
+    
+    db.session.add(Task(user_id=user.id, title='kg', platform='Kaggle'))
+    db.session.commit()
+    assert cached_counts(user) == {'LeetCode': 2, 'GitHub': 1, 'Kaggle': 1}
+    
+    task = Task.query.filter_by(platform='GitHub').one()
+    task.platform = 'LeetCode'
+    db.session.commit()
+    assert cached_counts(user) == {'LeetCode': 3, 'Kaggle': 1}
+    
+    db.session.delete(Task.query.filter_by(platform='Kaggle').one())
+    db.session.commit()
+    assert cached_counts(user) == {'LeetCode': 3}
+    assert user.get_platform_counts() == {'LeetCode': {'tasks': 3, 'archived': 0}}
+
+
+def test_several_flushes_in_one_transaction(user):
+    user.get_platform_counts()
+    
+    db.session.add(Task(user_id=user.id, title='kg', platform='Kaggle'))
+    db.session.flush()
+    db.session.add(Task(user_id=user.id, title='kg 2', platform='Kaggle'))
+    db.session.commit()
+    
+    assert cached_counts(user) == {'LeetCode': 2, 'GitHub': 1, 'Kaggle': 2}
+
+
+def test_rolled_back_writes_leave_the_cache_alone(user):
+    before = user.get_platform_counts()
+    
+    db.session.add(Task(user_id=user.id, title='kg', platform='Kaggle'))
+    db.session.flush()
+    db.session.rollback()
+    
+    assert platform_count_cache.get(user.id)[1] is before
+    assert user.get_platform_counts() is before
+
+
+def test_changes_from_other_processes_are_recounted(user):
+    user.get_platform_counts()
+    
+    # Another worker adds a task: its data version bump is not ours
+    tasks, users = Task.__table__, User.__table__
+    db.session.execute(tasks.insert().values(user_id=user.id, title='kg', platform='Kaggle', status='pending'))
+    db.session.execute(users.update().where(users.c.id == user.id).values(data_version=users.c.data_version + 1))
+    db.session.commit()
+    db.session.add(Task(user_id=user.id, title='kg 2', platform='Kaggle'))
+    db.session.commit()
+    
+    assert platform_count_cache.get(user.id) is None
+    assert user.get_platform_counts()['Kaggle']['tasks'] == 2
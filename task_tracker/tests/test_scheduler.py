@@ -0,0 +1,82 @@
+import json
+import httpx
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from leaderboards import scores_table
+from models import db, User, PlatformStats
+from scheduler import sync_all_platforms
+
+SETTINGS = {
+    'concurrency': 4,
+    'github_rate': 0,
+    'leetcode_rate': 0,
+    'leetcode_batch_size': 10,
+    'write_batch_size': 2,
+}
+
+
+def github_and_leetcode(request):
+    if request.url.host == 'leetcode.com':
+        variables = json.loads(request.content)['variables']
+        return httpx.Response(200, json={'data': {
+            alias: {'username': name, 'profile': {'ranking': 1, 'reputation': 0},
+                    'submitStats': {'acSubmissionNum': [{'difficulty': 'All', 'count': 42}]}}
+            for alias, name in variables.items()
+        }})
+    if request.url.path.endswith(('/repos', '/public')):
+        return httpx.Response(200, json=[])
+    return httpx.Response(200, json={'name': 'Octo', 'public_repos': 7})
+
+
+def add_user(name, platform):
+    user = User(username=name, email=f'{name}@example.com', password_hash='x')
+    db.session.add(user)
+    db.session.flush()
+    stat = PlatformStats(user_id=user.id, platform=platform)
+    stat.set_data({'username': name})
+    db.session.add(stat)
+    db.session.commit()
+    return user.id
+
+
+def test_sync_all_writes_results_in_bulk(app, mock_http):
+    mock_http(github_and_leetcode)
+    with app.app_context():
+        users = [add_user(f'gh{i}', 'github') for i in range(3)] + [add_user('lc0', 'leetcode')]
+        versions = dict(db.session.query(User.id, User.data_version))
+        
+        updated, failed = sync_all_platforms(SETTINGS, report=lambda message: None)
+        db.session.expire_all()
+        
+        assert (updated, failed) == (4, 0)
+        for stat in PlatformStats.query:
+            if stat.platform == 'github':
+                assert stat.get_data()['public_repos'] == 7
+            else:
+                assert stat.get_data()['problems_solved']['total'] == 42
+        for user_id, version in db.session.query(User.id, User.data_version):
+            assert version == versions[user_id] + 1
+        score = db.session.execute(
+            scores_table.select().where(scores_table.c.board == 'leetcode', scores_table.c.user_id == users[-1])
+        ).one()
+        assert score.score == 42
+
+
+def test_each_write_batch_is_one_update(app, mock_http):
+    mock_http(github_and_leetcode)
+    statements = []
+    
+    def count(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith('UPDATE platform_stats'):
+            statements.append(len(parameters) if executemany else 1)
+    
+    with app.app_context():
+        for i in range(4):
+            add_user(f'gh{i}', 'github')
+        event.listen(Engine, 'before_cursor_execute', count)
+        try:
+            sync_all_platforms(SETTINGS, report=lambda message: None)
+        finally:
+            event.remove(Engine, 'before_cursor_execute', count)
+    
+    assert statements == [2, 2]
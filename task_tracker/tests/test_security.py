@@ -0,0 +1,40 @@
+import pytest
+
+import security
+from security import login_allowed, login_ip_limiter, login_account_limiter
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(security.time, 'monotonic', lambda: now[0])
+    login_ip_limiter.configure(3, 60)
+    login_account_limiter.configure(2, 60)
+    yield now
+    login_ip_limiter.configure(20, 60)
+    login_account_limiter.configure(5, 60)
+
+
+def test_ip_limit_spans_accounts(clock):
+    results = [login_allowed('10.0.0.1', f'user{n}@example.com') for n in range(4)]
+    
+    assert results == [True, True, True, False]
+    assert login_allowed('10.0.0.2', 'user9@example.com')
+
+
+def test_account_limit_spans_ips(clock):
+    results = [login_allowed(f'10.0.0.{n}', 'Victim@Example.com ') for n in range(3)]
+    
+    assert results == [True, True, False]
+    assert not login_allowed('10.0.0.99', 'victim@example.com')
+    assert login_allowed('10.0.0.99', 'other@example.com')
+
+
+def test_buckets_refill_over_the_period(clock):
+    assert login_allowed('10.0.0.1', 'ann@example.com')
+    assert login_allowed('10.0.0.2', 'ann@example.com')
+    assert not login_allowed('10.0.0.3', 'ann@example.com')
+    
+    clock[0] += 30
+    assert login_allowed('10.0.0.3', 'ann@example.com')
+    assert not login_allowed('10.0.0.3', 'ann@example.com')
@@ -0,0 +1,32 @@
+import server
+
+
+def options_for(*argv):
+    return server.build_options(server.build_parser().parse_args(['serve', *argv]))
+
+
+def test_threaded_workers_are_preloaded(monkeypatch):
+    monkeypatch.delenv('WEB_WORKER_CLASS', raising=False)
+    options = options_for('--workers', '3', '--threads', '4', '--max-requests', '1000')
+    
+    assert options['worker_class'] == 'gthread'
+    assert options['workers'] == 3 and options['threads'] == 4
+    assert options['preload_app'] is True
+    assert options['worker_connections'] is None
+    assert options['max_requests_jitter'] == 100
+    assert options['post_fork'] is server.post_fork
+
+
+def test_single_thread_uses_sync_workers(monkeypatch):
+    monkeypatch.delenv('WEB_WORKER_CLASS', raising=False)
+    
+    assert options_for('--threads', '1')['worker_class'] == 'sync'
+
+
+def test_gevent_workers_load_the_app_after_fork(monkeypatch):
+    monkeypatch.setenv('WEB_WORKER_CLASS', 'gevent')
+    options = options_for('--worker-connections', '500')
+    
+    assert options['worker_class'] == 'gevent'
+    assert options['preload_app'] is False
+    assert options['worker_connections'] == 500
@@ -0,0 +1,216 @@
+from datetime import datetime, timedelta
+import pytest
+from models import db, User, Task, PlatformStats
+from conftest import register_and_login
+from sharding import shards, SHARD_ID_SPAN, ShardMoveFailed
+
+quiet = {'report': lambda message: None}
+
+
+@pytest.fixture
+def app(make_app, tmp_path):
+    return make_app(SHARD_DATABASE_URLS=[f'sqlite:///{tmp_path}/shard1.db', f'sqlite:///{tmp_path}/shard2.db'])
+
+
+def add_user(name, shard, tasks=1):
+    user = User(username=name, email=f'{name}@example.com', password_hash='x', shard=shard)
+    db.session.add(user)
+    db.session.commit()
+    with shards.using(shard):
+        for i in range(tasks):
+            db.session.add(Task(user_id=user.id, title=f'{name} {i}', platform='General'))
+        stat = PlatformStats(user_id=user.id, platform='github')
+        stat.set_data({'username': name})
+        db.session.add(stat)
+    db.session.commit()
+    return user.id
+
+
+def task_ids(shard, user_id=None):
+    with shards.using(shard):
+        query = db.session.query(Task.id)
+        if user_id is not None:
+            query = query.filter_by(user_id=user_id)
+        return sorted(i for (i,) in query)
+
+
+def in_range(shard, ids):
+    low = shard * SHARD_ID_SPAN
+    high = (shard + 1) * SHARD_ID_SPAN if shard else SHARD_ID_SPAN
+    return all(low <= i < high for i in ids)
+
+
+def test_move_keeps_data_and_switches_directory(app):
+    with app.app_context():
+        user_id = add_user('ann', 1, tasks=3)
+        
+        assert shards.move_user(user_id, 2, **quiet) == 4
+        
+        assert shards.shard_of(user_id, fresh=True) == 2
+        assert task_ids(1, user_id) == []
+        assert len(task_ids(2, user_id)) == 3
+        assert in_range(2, task_ids(2, user_id))
+        with shards.using(2):
+            assert PlatformStats.query.filter_by(user_id=user_id).count() == 1
+
+
+def test_ids_stay_unique_when_moving_back_and_forth(app):
+    with app.app_context():
+        mover = add_user('ann', 2, tasks=2)
+        shards.move_user(mover, 1, **quiet)
+        # Shard 1 keeps allocating from its own range after taking in rows
+        add_user('bob', 1)
+        shards.move_user(mover, 0, **quiet)
+        # Shard 0 has no AUTOINCREMENT, so it must not have seen shard 2's ids
+        add_user('cat', 0)
+        shards.move_user(mover, 2, **quiet)
+        shards.move_user(mover, 1, **quiet)
+        add_user('dan', 2)
+        
+        seen = []
+        for shard in shards.all():
+            ids = task_ids(shard)
+            assert in_range(shard, ids)
+            seen += ids
+        assert len(seen) == len(set(seen)) == 5
+
+
+def test_rebalance_evens_out_task_counts(app):
+    with app.app_context():
+        for i, tasks in enumerate([8, 6, 5, 3, 2]):
+            add_user(f'user{i}', 0, tasks=tasks)
+        
+        moves = shards.plan_rebalance(shards.loads(), tolerance=0.25)
+        for user_id, source, target in moves:
+            shards.move_user(user_id, target, **quiet)
+        
+        totals = {shard: sum(load.values()) for shard, load in shards.loads().items()}
+        assert sum(totals.values()) == 24
+        assert max(totals.values()) - min(totals.values()) <= 0.25 * max(totals.values())
+
+
+def test_plan_rebalance_does_nothing_when_balanced():
+    assert shards.plan_rebalance({0: {1: 5}, 1: {2: 5}, 2: {3: 4}}, tolerance=0.25) == []
+
+
+def leave_orphan(user_id, shard, moved_ago):
+    """Rows on a shard the user has moved away from"""
+    users = User.__table__
+    db.session.execute(users.update().where(users.c.id == user_id)
+                       .values(shard_moved_at=datetime.utcnow() - moved_ago))
+    db.session.commit()
+    with shards.using(shard):
+        db.session.add(Task(user_id=user_id, title='left behind', platform='General'))
+    db.session.commit()
+
+
+def test_purge_removes_rows_the_directory_does_not_point_to(app):
+    with app.app_context():
+        home = add_user('ann', 1, tasks=2)
+        moved = add_user('bob', 2)
+        leave_orphan(moved, 1, moved_ago=timedelta(hours=1))
+        
+        assert shards.purge_orphans(**quiet) == 1
+        
+        assert len(task_ids(1, home)) == 2
+        assert task_ids(1, moved) == []
+        assert len(task_ids(2, moved)) == 1
+
+
+def test_purge_leaves_moves_in_progress_alone(app):
+    with app.app_context():
+        moved = add_user('bob', 2)
+        leave_orphan(moved, 1, moved_ago=timedelta(seconds=1))
+        
+        assert shards.purge_orphans(**quiet) == 0
+        assert len(task_ids(1, moved)) == 1
+
+
+def test_purge_reads_the_directory_instead_of_the_cache(app):
+    with app.app_context():
+        user_id = add_user('ann', 1)
+        # Another process moved the user here; this one still caches shard 2
+        shards.directory.set(user_id, 2)
+        
+        assert shards.purge_orphans(**quiet) == 0
+        assert len(task_ids(1, user_id)) == 1
+
+
+def test_purge_removes_rows_of_abandoned_moves(app):
+    with app.app_context():
+        moved = add_user('bob', 2)
+        leave_orphan(moved, 1, moved_ago=timedelta(seconds=app.config['SHARD_MOVE_TIMEOUT'] + 1))
+        
+        assert shards.purge_orphans(**quiet) == 1
+
+
+def test_rows_written_during_the_copy_are_moved_too(app, monkeypatch):
+    with app.app_context():
+        user_id = add_user('ann', 1, tasks=2)
+        copy_rows = shards._copy_rows
+        
+        def copy_then_write(*args):
+            copied = copy_rows(*args)
+            if not monkeypatch.wrote:
+                # A request that loaded the user before the move was marked
+                monkeypatch.wrote = True
+                with shards.using(1):
+                    db.session.add(Task(user_id=user_id, title='late write', platform='General'))
+                db.session.commit()
+            return copied
+        monkeypatch.wrote = False
+        monkeypatch.setattr(shards, '_copy_rows', copy_then_write)
+        
+        assert shards.move_user(user_id, 2, **quiet) == 4
+        
+        assert task_ids(1, user_id) == []
+        with shards.using(2):
+            assert sorted(t.title for t in Task.query.filter_by(user_id=user_id)) == ['ann 0', 'ann 1', 'late write']
+
+
+def test_move_that_lost_its_mark_is_not_switched(app, monkeypatch):
+    with app.app_context():
+        user_id = add_user('ann', 1)
+        copy_rows = shards._copy_rows
+        
+        def copy_then_restart(*args):
+            # Another run of the move marks the user again meanwhile
+            copied = copy_rows(*args)
+            users = User.__table__
+            db.session.execute(users.update().where(users.c.id == user_id).values(shard_moved_at=datetime.utcnow()))
+            db.session.commit()
+            return copied
+        monkeypatch.setattr(shards, '_copy_rows', copy_then_restart)
+        
+        with pytest.raises(ShardMoveFailed):
+            shards.move_user(user_id, 2, **quiet)
+        assert shards.shard_of(user_id, fresh=True) == 1
+        assert len(task_ids(1, user_id)) == 1
+
+
+def test_writes_are_refused_while_a_move_runs(app):
+    client = app.test_client()
+    register_and_login(client, 'ann')
+    with app.app_context():
+        user = User.query.filter_by(username='ann').one()
+        user.shard_moved_at = datetime.utcnow()
+        db.session.commit()
+    
+    assert client.get('/tasks/').status_code == 200
+    response = client.post('/tasks/add', data={'title': 'new task', 'platform': 'Other'})
+    assert response.status_code == 503
+
+
+def test_writes_follow_the_directory_not_the_cache(app):
+    client = app.test_client()
+    register_and_login(client, 'ann')
+    with app.app_context():
+        user = User.query.filter_by(username='ann').one()
+        home, user_id = user.shard, user.id
+    # This process still remembers another shard for the user
+    shards.directory.set(user_id, (home + 1) % shards.count)
+    
+    client.post('/tasks/add', data={'title': 'new task', 'platform': 'Other'})
+    
+    with app.app_context():
+        assert len(task_ids(home, user_id)) == 1
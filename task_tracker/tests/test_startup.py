@@ -0,0 +1,27 @@
+import os
+import subprocess
+import sys
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules only the sync views, nightly jobs or the production server need;
+# importing the app must not pull them in
+LAZY_MODULES = ['httpx', 'scheduler', 'gunicorn']
+
+
+def loaded_modules(tmp_path):
+    """Run create_app() in a fresh interpreter; returns the names in sys.modules"""
+    env = dict(os.environ, DATABASE_URL=f'sqlite:///{tmp_path}/startup.db')
+    result = subprocess.run(
+        [sys.executable, '-c', 'import sys, app; app.create_app(); print("\\n".join(sys.modules))'],
+        capture_output=True, text=True, cwd=APP_DIR, env=env
+    )
+    assert result.returncode == 0, result.stderr[-2000:]
+    return set(result.stdout.split())
+
+
+def test_heavy_modules_are_imported_lazily(tmp_path):
+    modules = loaded_modules(tmp_path)
+    
+    assert 'app' in modules
+    assert [name for name in LAZY_MODULES if name in modules] == []
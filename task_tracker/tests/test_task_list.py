@@ -0,0 +1,51 @@
+import re
+from datetime import datetime, timedelta
+
+import pytest
+
+from conftest import register_and_login
+from models import db, User, Task, ArchivedTask
+
+
+@pytest.fixture
+def client(make_app):
+    app = make_app(TASK_LIST_CHUNK_SIZE=2)
+    client = app.test_client()
+    register_and_login(client, 'ann')
+    
+    # Live and archived tasks interleave by creation date, newest first: t0..t6
+    now = datetime.utcnow()
+    with app.app_context():
+        user_id = User.query.filter_by(username='ann').one().id
+        for age, title, platform, status in [(0, 't0', 'LeetCode', 'pending'), (2, 't2', 'GitHub', 'completed'),
+                                             (3, 't3', 'LeetCode', 'pending'), (6, 't6', 'LeetCode', 'completed')]:
+            db.session.add(Task(user_id=user_id, title=title, platform=platform, status=status,
+                                created_at=now - timedelta(days=age)))
+        # The archive may share the main database file through its own engine
+        db.session.commit()
+        for task_id, age, platform in [(101, 1, 'LeetCode'), (104, 4, 'GitHub'), (105, 5, 'LeetCode')]:
+            db.session.add(ArchivedTask(id=task_id, user_id=user_id, title=f't{age}', platform=platform,
+                                        created_at=now - timedelta(days=age), completed_at=now))
+        db.session.commit()
+    return client
+
+
+def titles(client, **params):
+    response = client.get('/tasks/', query_string=params)
+    assert response.is_streamed
+    return re.findall(r'<h5 class="card-title[^>]*>\s*(\S+)\s*</h5>', response.get_data(as_text=True))
+
+
+def test_live_tasks_stream_newest_first(client):
+    assert titles(client) == ['t0', 't2', 't3', 't6']
+
+
+def test_archived_tasks_are_merged_by_creation_date(client):
+    assert titles(client, archived='1') == ['t0', 't1', 't2', 't3', 't4', 't5', 't6']
+
+
+def test_filters_apply_to_both_sources(client):
+    assert titles(client, archived='1', platform='LeetCode') == ['t0', 't1', 't3', 't5', 't6']
+    assert titles(client, archived='1', status='completed') == ['t1', 't2', 't4', 't5', 't6']
+    # Archived tasks are all completed
+    assert titles(client, archived='1', status='pending') == ['t0', 't3']
@@ -35,7 +35,7 @@ def check_dependencies():
         'flask_wtf',
         'flask_sqlalchemy',
         'wtforms',
-        'requests',
+        'httpx',
         'dotenv'
     ]
     